@@ -12,6 +12,22 @@
 
    author: joel.king@wwt.com
 
+   Revision history:
+     18 Oct 2026  |  bulk ingest of containers and their artifacts over a pooled session
+     18 Oct 2026  |  buffered mode, artifacts are queued and sent in batches by a background thread
+     18 Oct 2026  |  timeouts, retry with exponential backoff and jitter, circuit breaker
+     18 Oct 2026  |  spool to SQLite while the host is unavailable, replay with container id remapping
+     18 Oct 2026  |  skip duplicate artifacts using a cache of content hashes
+     18 Oct 2026  |  upsert containers, add to an open container with the same source_data_identifier or name
+     18 Oct 2026  |  optionally record the latency of each request, for phantom_bulk_load.py
+     18 Oct 2026  |  fastest available JSON encoder and decoder, each response parsed once
+     18 Oct 2026  |  ProcessIngest, build and send containers in a pool of worker processes
+     18 Oct 2026  |  retry a POST only if it was not received, or its records all have a source_data_identifier
+     18 Oct 2026  |  bulk_ingest spools the containers and artifacts which cannot be sent, as add_container does
+     18 Oct 2026  |  claim the upsert keys looked up, so concurrent batches create a container with a key once
+     18 Oct 2026  |  ProcessIngest builds the DedupCache of each worker from dedup_path, does not upsert
+     18 Oct 2026  |  a list POST answered 200 with an unexpected body is not sent again one record at a time
+
 """
 
 import sys, os
@@ -19,19 +35,318 @@ import time
 import getpass
 import requests
 import json
+import hashlib
+import random
+import sqlite3
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+try:
+    from requests.packages.urllib3.exceptions import NewConnectionError
+except ImportError:
+    from requests.packages.urllib3.exceptions import ConnectTimeoutError as NewConnectionError
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+try:
+    import orjson
+
+    def json_dumps(obj):
+        "Return obj encoded as JSON, as bytes"
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    json_loads = orjson.loads
+except ImportError:
+    try:
+        import ujson as fast_json
+    except ImportError:
+        fast_json = json                                   # the C accelerated encoder, faster than simplejson
+
+    def json_dumps(obj):
+        "Return obj encoded as JSON, as bytes"
+        encoded = fast_json.dumps(obj)
+        return encoded if isinstance(encoded, bytes) else encoded.encode('utf-8')
+
+    json_loads = fast_json.loads
+
+BULK_WORKERS = 4                                           # concurrent POSTs during bulk ingest
+BULK_BATCH_SIZE = 100                                      # containers, or artifacts, in each list POST
+BUFFER_FLUSH_INTERVAL = 1.0                                # seconds a queued artifact may wait for its batch to fill
+BUFFER_MAX_QUEUED = 10000                                  # add_artifact blocks while this many artifacts are queued
+
+CONNECT_TIMEOUT = 10                                       # seconds to establish a connection
+READ_TIMEOUT = 60                                          # seconds to wait for the response
+RETRIES = 4                                                # attempts after the first, for errors which may be transient
+RETRY_STATUS = (429, 502, 503, 504)                        # status codes which are retried
+POST_RETRY_STATUS = (429, 503)                             # status codes of a POST the host did not act on
+BACKOFF_BASE = 0.5                                         # seconds, doubled for each retry, before jitter
+BACKOFF_MAX = 30                                           # seconds, the most to wait between attempts
+BREAKER_FAILURES = 5                                       # consecutive failures which open the circuit breaker
+BREAKER_RESET = 30                                         # seconds the circuit stays open before a trial request
+SPOOL_REPLAY_INTERVAL = 30                                 # seconds between attempts of the replay thread to drain the spool
+DEDUP_MAX_ENTRIES = 100000                                 # artifact hashes kept in memory
+DEDUP_TTL = 86400                                          # seconds an artifact hash is remembered
+PROCESS_CHUNK_SIZE = 500                                   # records sent to a worker process at a time
+CONTAINER_CACHE_TTL = 300                                  # seconds a container found by upsert is used without a lookup
+CONTAINER_LOOKUP_PAGE_SIZE = 1000                          # containers returned by the lookup GET
+
+FLUSH = "flush"                                            # markers queued for the flusher thread
+STOP = "stop"
+
+
+class IngestConnectionError(Exception):
+    "Raised when no response is received from the host"
+    pass
+
+
+class CircuitOpenError(IngestConnectionError):
+    "Raised without a request to the host, while the circuit breaker is open"
+    pass
+
+
+TRANSIENT_ERRORS = ['ConnectionError', 'CircuitOpen'] + ["Failure to communicate: %s" % code for code in RETRY_STATUS]
+
+
+class CircuitBreaker(object):
+    """Count consecutive failures; after failures in a row, the circuit opens and requests fail at once for
+       reset seconds. Then one trial request is allowed, which closes the circuit on success or reopens it."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.count = 0
+        self.opened = None                                 # time the circuit opened, None when closed
+        self.trial = False                                 # a trial request is in flight
+        self.lock = threading.Lock()
+
+    def allow(self):
+        "Return True if a request may be sent"
+
+        with self.lock:
+            if self.opened is None:
+                return True
+            if self.trial or time.time() - self.opened < self.reset:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.count = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.count += 1
+            if self.trial or self.count >= self.failures:
+                self.opened = time.time()
+            self.trial = False
+
+
+class Spool(object):
+    """Append only store of the containers and artifacts waiting for the host, in a SQLite database in WAL mode.
+
+       A spooled container is known by a local id, the negative of its sequence number, until it is created.
+       Artifacts spooled with a local container id are sent with the id of the container once it is created."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS pending (seq INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, record TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS containers (local_id INTEGER PRIMARY KEY, container_id INTEGER)")
+        self.db.commit()
+
+    def add(self, kind, record):
+        "Append a 'container' or 'artifact' record, return the local id of a container"
+
+        with self.lock:
+            seq = self.db.execute("INSERT INTO pending (kind, record) VALUES (?, ?)", (kind, json.dumps(record))).lastrowid
+            self.db.commit()
+        return -seq if kind == 'container' else None
+
+    def pending(self, limit):
+        "Return the oldest (seq, kind, record) waiting"
+
+        with self.lock:
+            rows = self.db.execute("SELECT seq, kind, record FROM pending ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, kind, json.loads(record)) for seq, kind, record in rows]
+
+    def remove(self, seqs, created=()):
+        "Remove the records sent, remember the (local id, container id) of the containers created"
+
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO containers VALUES (?, ?)", created)
+            self.db.executemany("DELETE FROM pending WHERE seq = ?", [(seq,) for seq in seqs])
+            self.db.commit()
+
+    def container_id(self, local_id):
+        "Return the id of a spooled container once created, else None"
+
+        with self.lock:
+            row = self.db.execute("SELECT container_id FROM containers WHERE local_id = ?", (local_id,)).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class DedupCache(object):
+    """Remember the artifacts sent, by a hash of their container id, source_data_identifier and CEF fields, so that
+       duplicates are not sent again. The most recently used maxsize hashes are kept in memory; with path, the hashes
+       are also kept in a SQLite database, so they survive a restart. A hash is forgotten ttl seconds after it was
+       first seen, or never if ttl is None."""
+
+    def __init__(self, maxsize=DEDUP_MAX_ENTRIES, path=None, ttl=DEDUP_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()                       # hash: [artifact id, time first seen]
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS seen (hash TEXT PRIMARY KEY, artifact_id INTEGER, seen REAL)")
+            if ttl is not None:
+                self.db.execute("DELETE FROM seen WHERE seen < ?", (time.time() - ttl,))
+            self.db.commit()
+
+    @staticmethod
+    def key(record):
+        "Return the hash of the artifact record, the CEF fields in a canonical JSON form"
+
+        canonical = json.dumps([record.get('container_id'), record.get('source_data_identifier'), record.get('cef')],
+                               sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def seen(self, record):
+        """Return (True, artifact id) if the artifact was seen before, the id is None if it is not yet created.
+           Otherwise return (False, None) and remember the artifact as seen."""
+
+        key = self.key(record)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute("SELECT artifact_id, seen FROM seen WHERE hash = ?", (key,)).fetchone()
+                entry = list(row) if row else None
+            if entry is not None and (self.ttl is None or now - entry[1] < self.ttl):
+                self.hits += 1
+                self.entries.pop(key, None)                # move to the most recently used end
+                self.entries[key] = entry
+                self.trim()
+                return True, entry[0]
+
+            self.misses += 1
+            self.entries.pop(key, None)
+            self.entries[key] = [None, now]
+            self.trim()
+            return False, None
+
+    def created(self, record, artifact_id):
+        "Record the id of an artifact which was created"
+
+        key = self.key(record)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [artifact_id, time.time()]
+                self.trim()
+            entry[0] = artifact_id
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO seen VALUES (?, ?, ?)", (key, artifact_id, entry[1]))
+                self.db.commit()
+
+    def forget(self, record):
+        "Forget an artifact which was not created, so it will be sent if seen again"
+
+        with self.lock:
+            self.entries.pop(self.key(record), None)
+
+    def trim(self):
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
 
 
 class PhantomIngest(object):
     "Ingest data to Phantom via the REST API"
 
-    def __init__(self, phantom_host, token):
-        " The container and artifact common fields can be overridden by using kwargs when calling the method."
+    def __init__(self, phantom_host, token, workers=BULK_WORKERS, buffered=False, batch_size=BULK_BATCH_SIZE,
+                 flush_interval=BUFFER_FLUSH_INTERVAL, max_queued=BUFFER_MAX_QUEUED,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES, spool=None, dedup=None):
+        """ The container and artifact common fields can be overridden by using kwargs when calling the method.
+            All requests are sent over one session, which keeps up to workers connections alive to the host.
+
+            When buffered, add_artifact queues the artifact and returns None. A background thread sends the queued
+            artifacts as a list POST when batch_size are queued, or flush_interval seconds after the first was queued.
+            add_artifact blocks while max_queued artifacts are waiting. Call flush() to send the queued artifacts and
+            collect the failures, or use the instance as a context manager.
+
+            Each request has a (connect, read) timeout in seconds. Connection errors, timeouts and the RETRY_STATUS
+            codes are retried up to retries times with exponential backoff and jitter. A POST may have been acted on
+            by the host even though no response arrived, and Phantom only reports a duplicate, rather than creating it
+            twice, if it has the same source_data_identifier. So a POST is retried after a read timeout or a 502 or
+            504 only if every record has a source_data_identifier; otherwise only if it was never received, a
+            connection error, or POST_RETRY_STATUS.
+            After BREAKER_FAILURES consecutive failures, requests fail with CircuitOpenError for BREAKER_RESET seconds.
+
+            With spool, the path of a SQLite database, containers and artifacts which cannot be sent because the host
+            is unavailable are written to the spool rather than raising an exception. add_container then returns a
+            negative local id, which can be used with add_artifact. Call replay(), or start_replay() for a background
+            thread, to send them when the host returns.
+
+            With dedup, a DedupCache, an artifact is not sent if an artifact with the same container id,
+            source_data_identifier and CEF fields was sent before; add_artifact returns the id of the earlier artifact."""
 
         self.headers = {"ph-auth-token": token}
         self.url =  "https://%s/rest" % phantom_host
         self.container_id = None
         self.content = None
         self.message = None
+        self.workers = workers
+        self.list_post = True                              # False once the host does not support list POST
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = CircuitBreaker()
+        self.latencies = None                              # set to a list to record the seconds taken by each request
+        self.body = None                                   # the parsed body of the last response of add_*
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer_errors = []                            # (artifact, error message) of each queued artifact not created
+        self.buffer = None
+        self.flusher = None
+        self.spool = Spool(spool) if spool else None
+        self.spool_errors = []                             # (record, error message) of each spooled record not created
+        self.replayer = None
+        self.replay_stop = threading.Event()
+        self.dedup = dedup
+        self.containers = {}                               # (field, value): (container id, time found) for upsert
+        self.claims = {}                                   # (field, value): Event set when the claimant caches it
+        self.containers_lock = threading.Lock()
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.verify = False
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
         self.container_common = {"description": "A brief useful description of the behavior tracked by this container",
                                  "name": "A short friendly name for the container",
@@ -53,7 +368,12 @@ class PhantomIngest(object):
         except AttributeError:
             # Older versions of Requests do not support 'disable_warnings'
             pass
- 
+
+        if buffered:
+            self.buffer = Queue.Queue(maxsize=max_queued)
+            self.flusher = threading.Thread(target=self.flush_buffer, name="PhantomIngest flusher")
+            self.flusher.daemon = True
+            self.flusher.start()
 
     def add_container(self, **kwargs):
         """Containers are objects which document incidents, specify updates or additions to the
@@ -61,55 +381,741 @@ class PhantomIngest(object):
 
         url = "%s/container" % self.url
 
-        data = self.container_common.copy()
-        for key, value in kwargs.items():                  # add or update container common fields
-            data[key] = value
+        data = self.container_record(**kwargs)
 
-        try:        
-            r = requests.post(url, data=json.dumps(data), headers=self.headers, verify=False)
-        except requests.ConnectionError as e: 
-            raise Exception('ConnectionError')
+        try:
+            r = self.post(url, data)
+        except IngestConnectionError:
+            if self.spool is None:
+                raise
+            r = None
+        if self.spool is not None and (r is None or r.status_code in RETRY_STATUS):
+            self.container_id = self.spool.add('container', data)
+            return self.container_id
 
-        self.store_requests_status(r)
-        assert (r.status_code is requests.codes.ok), "Failure to communicate: %s" % r.status_code
+        body = self.store_requests_status(r)
+        assert (r.status_code == requests.codes.ok), "Failure to communicate: %s" % r.status_code
 
-        self.container_id = r.json().get('id')
+        self.container_id = body.get('id')
 
         return self.container_id
 
+    def upsert_container(self, **kwargs):
+        """Return the id of the open container with the same source_data_identifier, or the same name if there is no
+           source_data_identifier, as the container specified by kwargs; if there is none, create the container."""
+
+        data = self.container_record(**kwargs)
+        key = self.container_key(data)
+
+        try:
+            self.container_id = self.find_containers([key]).get(key)
+            if self.container_id is None:
+                self.container_id = self.add_container(**kwargs)
+                self.cache_containers([(key, self.container_id)])
+        finally:
+            self.release_containers([key])
+
+        return self.container_id
+
+    @staticmethod
+    def container_key(data):
+        "Return the field and value identifying the container for upsert"
+
+        if data.get('source_data_identifier') is not None:
+            return 'source_data_identifier', data['source_data_identifier']
+        return 'name', data.get('name')
+
+    def find_containers(self, keys):
+        """Return a dictionary of the id of the open container, the newest if there are several, for each of the
+           (field, value) keys found. Keys cached within CONTAINER_CACHE_TTL are not looked up again, the others are
+           looked up with one filtered GET for each field.
+
+           The keys looked up are claimed, so that only one thread creates the container of a key: a thread which
+           needs a key claimed by another waits until it is released, then uses the cached container. The caller
+           must cache_containers, or release_containers, the keys claimed and not found. Claims are taken all at once
+           and a thread waits holding none, so two threads never wait on each other."""
+
+        found = {}
+        missing = {}
+        keys = set(keys)
+        while keys:
+            waits = []
+            now = time.time()
+            with self.containers_lock:
+                for key in keys:
+                    container_id, when = self.containers.get(key, (None, 0))
+                    if now - when < CONTAINER_CACHE_TTL:
+                        found[key] = container_id
+                    elif key in self.claims:
+                        waits.append(self.claims[key])
+                keys.difference_update(found)
+                if not waits:
+                    for key in keys:
+                        self.claims[key] = threading.Event()
+                        missing.setdefault(key[0], set()).add(key[1])
+                    break
+            for event in waits:
+                event.wait()
+
+        try:
+            found.update(self.lookup_containers(missing))
+        except Exception:
+            self.release_containers((field, value) for field, values in missing.items() for value in values)
+            raise
+        return found
+
+    def lookup_containers(self, missing):
+        "Return a dictionary of the id of the newest open container for each key found, missing maps field to values"
+
+        found = {}
+        for field, values in missing.items():
+            params = {"_filter_%s__in" % field: json.dumps(sorted(values)),
+                      "_exclude_status": '"closed"',
+                      "sort": "id",
+                      "order": "desc",
+                      "page_size": CONTAINER_LOOKUP_PAGE_SIZE}
+            try:
+                r = self.request("GET", "%s/container" % self.url, params=params)
+            except IngestConnectionError:
+                if self.spool is None:
+                    raise
+                continue                                   # not found, the caller creates or spools them
+            if self.spool is not None and r.status_code in RETRY_STATUS:
+                continue
+            assert (r.status_code == requests.codes.ok), "Failure to communicate: %s" % r.status_code
+
+            newest = []
+            for container in json_loads(r.content).get('data', []):
+                key = (field, container.get(field))
+                if key[1] in values and key not in found:
+                    found[key] = container['id']
+                    newest.append((key, container['id']))
+            self.cache_containers(newest)
+
+        return found
+
+    def cache_containers(self, containers):
+        "Cache the (key, container id) found or created, release the claims of the keys"
+
+        now = time.time()
+        with self.containers_lock:
+            for key, container_id in containers:
+                if container_id is not None:
+                    self.containers[key] = (container_id, now)
+                claim = self.claims.pop(key, None)
+                if claim is not None:
+                    claim.set()
+
+    def release_containers(self, keys):
+        "Release the claims of the keys, see find_containers"
+
+        self.cache_containers([(key, None) for key in keys])
+
     def add_artifact(self, container_id, cef, meta_data, **kwargs):
         "Artifacts provde supporting information for their container object"
 
         url = "%s/artifact" % self.url
 
+        data = self.artifact_record(container_id, cef, meta_data, **kwargs)
+
+        if self.spool is not None and container_id < 0:    # a spooled container
+            data['container_id'] = self.spool.container_id(container_id)
+            if data['container_id'] is None:
+                data['container_id'] = container_id
+                self.spool.add('artifact', data)
+                return None
+
+        if self.dedup is not None:
+            duplicate, artifact_id = self.dedup.seen(data)
+            if duplicate:
+                return artifact_id
+
+        if self.buffer:
+            self.buffer.put(data)                          # blocks while the queue is full
+            return None
+
+        try:
+            r = self.post(url, data)
+        except IngestConnectionError:
+            if self.spool is None:
+                self.forget(data)
+                raise
+            r = None
+        if self.spool is not None and (r is None or r.status_code in RETRY_STATUS):
+            self.spool.add('artifact', data)
+            return None
+
+        body = self.store_requests_status(r)
+        if r.status_code != requests.codes.ok:
+            self.forget(data)
+        assert (r.status_code == requests.codes.ok), "Failure to communicate: %s" % r.status_code
+
+        self.artifact_id = body.get('id')                  # '{"id": 24, "success": true}'
+        if self.dedup is not None:
+            self.dedup.created(data, self.artifact_id)
+        
+        return self.artifact_id
+
+    def flush(self):
+        """Send the queued artifacts, wait until they are sent, and return a list of (artifact, error message)
+           for those not created since the last flush."""
+
+        if self.buffer:
+            self.buffer.put(FLUSH)
+            self.buffer.join()
+
+        errors, self.buffer_errors = self.buffer_errors, []
+        return errors
+
+    def close(self):
+        "Send the queued artifacts, stop the flusher and replay threads and close the session, return the failures"
+
+        errors = self.flush()
+        if self.flusher:
+            self.buffer.put(STOP)
+            self.flusher.join()
+            self.buffer = self.flusher = None
+        if self.replayer:
+            self.replay_stop.set()
+            self.replayer.join()
+            self.replayer = None
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.session.close()
+        return errors
+
+    def replay(self, batch_size=BULK_BATCH_SIZE):
+        """Send the spooled records in order, in list POSTs of up to batch_size, until the spool is empty or the
+           host is unavailable. Return the number of records removed from the spool. Records the host rejects are
+           removed and added to self.spool_errors, as are the artifacts of a container which was rejected."""
+
+        removed = 0
+        while True:
+            rows = self.spool.pending(batch_size)
+            if not rows:
+                return removed
+
+            containers = [(seq, record) for seq, kind, record in rows if kind == 'container']
+            done = []
+            created = []
+            for (seq, record), (container_id, error) in zip(containers, self.create("%s/container" % self.url,
+                                                                                       [record for seq, record in containers])):
+                if container_id is not None:
+                    created.append((-seq, container_id))
+                elif error in TRANSIENT_ERRORS:
+                    break
+                else:
+                    self.spool_errors.append((record, error))
+                done.append(seq)
+            self.spool.remove(done, created)
+            removed += len(done)
+            if len(done) < len(containers):
+                return removed
+
+            artifacts = []
+            done = []
+            for seq, kind, record in rows:
+                if kind != 'artifact':
+                    continue
+                if record['container_id'] < 0:             # containers are spooled before their artifacts
+                    record['container_id'] = self.spool.container_id(record['container_id'])
+                    if record['container_id'] is None:
+                        self.spool_errors.append((record, "Container not created"))
+                        done.append(seq)
+                        continue
+                artifacts.append((seq, record))
+            for (seq, record), (artifact_id, error) in zip(artifacts, self.create("%s/artifact" % self.url,
+                                                                                     [record for seq, record in artifacts])):
+                if artifact_id is None and error in TRANSIENT_ERRORS:
+                    break
+                if artifact_id is None:
+                    self.spool_errors.append((record, error))
+                done.append(seq)
+            self.spool.remove(done)
+            removed += len(done)
+            if len(done) < len(rows) - len(containers):
+                return removed
+
+    def start_replay(self, interval=SPOOL_REPLAY_INTERVAL):
+        "Start a background thread which calls replay() every interval seconds, until close()"
+
+        def replayer():
+            while not self.replay_stop.is_set():
+                try:
+                    self.replay()
+                except Exception:                          # keep the thread alive, try again later
+                    pass
+                self.replay_stop.wait(interval)
+
+        self.replay_stop.clear()
+        self.replayer = threading.Thread(target=replayer, name="PhantomIngest replay")
+        self.replayer.daemon = True
+        self.replayer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def flush_buffer(self):
+        "Run in the flusher thread, send the queued artifacts in batches until STOP is queued"
+
+        stop = False
+        while not stop:
+            records = []
+            markers = 0
+            data = self.buffer.get()
+            deadline = time.time() + self.flush_interval
+            while True:
+                if data in (FLUSH, STOP):
+                    markers += 1
+                    stop = data == STOP
+                    break
+                records.append(data)
+                if len(records) >= self.batch_size:
+                    break
+                try:
+                    data = self.buffer.get(timeout=max(deadline - time.time(), 0))
+                except Queue.Empty:
+                    break
+
+            try:
+                created = self.create("%s/artifact" % self.url, records)
+            except Exception as e:                         # keep the thread alive, flush() waits on it
+                created = [(None, str(e))] * len(records)
+            for record, (artifact_id, error) in zip(records, created):
+                if artifact_id is None and error in TRANSIENT_ERRORS and self.spool is not None:
+                    self.spool.add('artifact', record)
+                    continue
+                if error:
+                    self.buffer_errors.append((record, error))
+                self.remember(record, artifact_id)
+
+            for _ in range(len(records) + markers):
+                self.buffer.task_done()
+
+    def remember(self, record, artifact_id):
+        "Record the id of the artifact in the dedup cache, or forget the artifact if it was not created"
+
+        if self.dedup is None:
+            return
+        if artifact_id is None:
+            self.dedup.forget(record)
+        else:
+            self.dedup.created(record, artifact_id)
+
+    def forget(self, record):
+        if self.dedup is not None:
+            self.dedup.forget(record)
+
+    def container_record(self, **kwargs):
+        "Return the container common fields, updated by kwargs"
+
+        data = self.container_common.copy()
+        data.update(kwargs)                                # add or update container common fields
+        return data
+
+    def artifact_record(self, container_id, cef, meta_data, **kwargs):
+        "Return the artifact common fields, updated by kwargs, with the CEF, meta data and container id"
+
         data = self.artifact_common.copy()
-        for key, value in kwargs.items():                  # add or update artifact common fields
-            data[key] = value
+        data.update(kwargs)                                # add or update artifact common fields
 
         data['cef'] = cef                                  # Common Event Format (CEF) fields
         data['data'] = meta_data                           # The "data" key can contain arbitrary json data.
         data['container_id'] = container_id
+        return data
+
+    def post(self, url, data):
+        """POST the record, or list of records, JSON encoded over the session. The request is idempotent, and retried
+           as a GET is, only if every record has a source_data_identifier"""
+
+        records = data if isinstance(data, list) else [data]
+        idempotent = all(record.get('source_data_identifier') for record in records)
+        return self.request("POST", url, data=json_dumps(data), idempotent=idempotent)
 
+    def request(self, method, url, idempotent=None, **kwargs):
+        """Send the request over the session, retrying connection errors, timeouts and RETRY_STATUS responses.
+           Unless idempotent, which defaults to True for all but POST, only errors where the request was never
+           received by the host, and POST_RETRY_STATUS responses, are retried.
+           Return the last response, or raise IngestConnectionError('ConnectionError') if no response was received,
+           or CircuitOpenError if the circuit breaker is open."""
+
+        if idempotent is None:
+            idempotent = method != "POST"
+        started = time.time()
         try:
-            r = requests.post(url, data=json.dumps(data), headers=self.headers, verify=False)
-        except requests.ConnectionError as e: 
-            raise Exception('ConnectionError')
+            return self.send(method, url, idempotent, **kwargs)
+        finally:
+            if self.latencies is not None:
+                self.latencies.append(time.time() - started)
 
-        self.store_requests_status(r)
-        assert (r.status_code is requests.codes.ok), "Failure to communicate: %s" % r.status_code
+    def send(self, method, url, idempotent, **kwargs):
+        "Send the request with retries, see request"
 
-        self.artifact_id = r.json().get('id')              # '{"id": 24, "success": true}'
-        
-        return self.artifact_id
+        retry_status = RETRY_STATUS if idempotent else POST_RETRY_STATUS
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError('CircuitOpen')
+
+            retry_after = None
+            try:
+                r = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                r = None
+                if not (idempotent or self.not_sent(e)):
+                    self.breaker.failure()
+                    break
+            except Exception:
+                self.breaker.failure()                     # release a trial request
+                raise
+            else:
+                if r.status_code not in retry_status:
+                    if r.status_code in RETRY_STATUS:
+                        self.breaker.failure()
+                    else:
+                        self.breaker.success()
+                    return r
+                retry_after = r.headers.get('Retry-After')
+
+            self.breaker.failure()
+            if attempt < self.retries:
+                time.sleep(self.backoff(attempt, retry_after))
+
+        if r is None:
+            raise IngestConnectionError('ConnectionError')
+        return r
+
+    @staticmethod
+    def not_sent(error):
+        "Return True if the request which raised error never reached the host, the connection was not established"
+
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(error.args[0] if error.args else None, NewConnectionError) or \
+            isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def backoff(attempt, retry_after=None):
+        "Return the seconds to wait before the next attempt, the Retry-After header if any, else with full jitter"
+
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except (TypeError, ValueError):
+            return random.uniform(0, min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX))
+
+    def bulk_ingest(self, containers, batch_size=BULK_BATCH_SIZE, upsert=False):
+        """Create many containers and their artifacts, returning a list with a result for each container, in order.
+
+           containers is an iterable of dictionaries of container fields, as the kwargs of add_container, each
+           optionally with a list of artifacts under the key 'artifacts'. Each artifact is a dictionary with the
+           optional keys 'cef' and 'data', and any artifact fields, as the kwargs of add_artifact.
+
+           Each result is a dictionary with the container 'id' (None if it was not created), the 'artifact_ids'
+           (None for each artifact not created) and a list of 'errors'. Exceptions are not raised for the items.
+
+           The containers are sent in batches, each batch as one list POST of the containers, followed by one list
+           POST of all their artifacts. Up to self.workers batches are sent concurrently. If the host does not accept
+           a list POST, each container and artifact of the batch is sent on its own.
+
+           With upsert, the artifacts of a container are added to the open container with the same
+           source_data_identifier, or name, if there is one, as upsert_container; it is looked up with one GET for
+           each batch. Containers of the feed with the same identifier are created once.
+
+           With a spool, containers and artifacts which fail with one of the TRANSIENT_ERRORS are spooled rather
+           than reported as errors. A spooled container has its negative local id as the result 'id', and its
+           artifacts, like other spooled artifacts, have None as their id; replay() sends them.
+        """
+        pool = ThreadPool(self.workers)
+        try:
+            results = []
+            for batch_results in pool.imap(lambda batch: self.ingest_batch(batch, upsert),
+                                           self.batches(containers, batch_size)):
+                results.extend(batch_results)
+            return results
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def batches(iterable, size):
+        "Generator which yields lists of up to size items from the iterable"
+
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def ingest_batch(self, batch, upsert=False):
+        "Create, or with upsert find, the containers in the batch and then their artifacts, return a result for each"
+
+        results = []
+        containers = []
+        for item in batch:
+            fields = dict(item)
+            artifacts = fields.pop('artifacts', None) or []
+            results.append(dict(id=None, artifact_ids=[None] * len(artifacts), errors=[], artifacts=artifacts))
+            containers.append(self.container_record(**fields))
+
+        keys = [self.container_key(container) for container in containers] if upsert else [None] * len(containers)
+        found = {}
+        if upsert:
+            try:
+                found = self.find_containers(set(keys))
+            except Exception as e:
+                for result in results:
+                    result['errors'].append(str(e))
+                return self.batch_results(results)
+
+        new = []                                           # (result, container, key) to create, once for each key
+        for result, container, key in zip(results, containers, keys):
+            if key not in found:
+                new.append((result, container, key))
+                if key is not None:
+                    found[key] = None                      # created by the first container with the key
+
+        failed = {}                                        # key: error message of a container not created
+        try:
+            created = self.create("%s/container" % self.url, [container for _, container, _ in new])
+            for (result, container, key), (container_id, error) in zip(new, created):
+                if container_id is None and error in TRANSIENT_ERRORS and self.spool is not None:
+                    container_id, error = self.spool.add('container', container), None
+                result['id'] = container_id
+                if error:
+                    result['errors'].append(error)
+                if key is not None:
+                    found[key] = container_id
+                    if container_id is None:
+                        failed[key] = error
+        finally:
+            if upsert:                                     # cache the keys claimed by find_containers, and release them
+                self.cache_containers([(key, found[key]) for _, _, key in new])
+        if upsert:
+            for result, key in zip(results, keys):
+                result['id'] = found[key]
+                if result['id'] is None and not result['errors']:   # the container of the key was not created
+                    result['errors'].append(failed.get(key) or "Container not created")
+
+        artifacts = []                                     # (result, index) of each artifact to create
+        records = []
+        duplicates = []                                    # (result, index, hash) of duplicates of artifacts in this batch
+        for result in results:
+            container_id = result['id']
+            if container_id is None:
+                continue
+            if container_id < 0:                           # a spooled container, perhaps replayed since
+                container_id = self.spool.container_id(container_id) or container_id
+            for index, artifact in enumerate(result['artifacts']):
+                fields = dict(artifact)
+                cef = fields.pop('cef', {})
+                meta_data = fields.pop('data', {})
+                record = self.artifact_record(container_id, cef, meta_data, **fields)
+                if self.dedup is not None:
+                    duplicate, result['artifact_ids'][index] = self.dedup.seen(record)
+                    if duplicate:
+                        if result['artifact_ids'][index] is None:
+                            duplicates.append((result, index, self.dedup.key(record)))
+                        continue
+                if container_id < 0:
+                    self.spool.add('artifact', record)
+                    continue
+                artifacts.append((result, index))
+                records.append(record)
+
+        created = self.create("%s/artifact" % self.url, records)
+        for (result, index), record, (artifact_id, error) in zip(artifacts, records, created):
+            if artifact_id is None and error in TRANSIENT_ERRORS and self.spool is not None:
+                self.spool.add('artifact', record)
+                continue
+            result['artifact_ids'][index] = artifact_id
+            if error:
+                result['errors'].append(error)
+            self.remember(record, artifact_id)
+
+        if duplicates:
+            created_ids = dict((self.dedup.key(record), artifact_id) for record, (artifact_id, error) in zip(records, created))
+            for result, index, key in duplicates:
+                result['artifact_ids'][index] = created_ids.get(key)
+
+        return self.batch_results(results)
+
+    @staticmethod
+    def batch_results(results):
+        "Remove the artifacts from the results of a batch"
+
+        for result in results:
+            del result['artifacts']
+        return results
+
+    def create(self, url, records):
+        """POST the records as a list, or one at a time, return an (id, error message) for each record in order.
+           If a list POST is answered 200 but not with a list of a result for each record, the host may have created
+           them, so they are not sent again: each gets the error 'Invalid response', and later records are sent one
+           at a time."""
+
+        if not records:
+            return []
+
+        if self.list_post:
+            try:
+                r = self.post(url, records)
+            except Exception as e:
+                return [(None, str(e))] * len(records)
+            if r.status_code == requests.codes.ok:
+                try:
+                    body = json_loads(r.content)
+                except ValueError:
+                    body = None
+                if isinstance(body, list) and len(body) == len(records):
+                    return [self.created(item) for item in body]
+                self.list_post = False                     # the host does not support list POST
+                return [(None, "Invalid response")] * len(records)
+            elif r.status_code != requests.codes.bad_request:
+                return [(None, "Failure to communicate: %s" % r.status_code)] * len(records)
+                                                           # on bad request, POST each to find the invalid records
+
+        return [self.create_one(url, record) for record in records]
+
+    def create_one(self, url, record):
+        "POST one record, return its (id, error message)"
+
+        try:
+            r = self.post(url, record)
+        except Exception as e:
+            return None, str(e)
+        if r.status_code != requests.codes.ok:
+            return None, "Failure to communicate: %s" % r.status_code
+        try:
+            return self.created(json_loads(r.content))
+        except (ValueError, AttributeError):
+            return None, "Invalid response"
+
+    @staticmethod
+    def created(body):
+        """Return (id, error message) from the response body for one record, '{"id": 24, "success": true}'.
+           A duplicate, as a retried POST the host had acted on, is not an error: its id is that of the existing one."""
+
+        if body.get('success'):
+            return body.get('id'), None
+        existing = body.get('existing_container_id', body.get('existing_artifact_id'))
+        if existing is not None:
+            return existing, None
+        return body.get('id'), body.get('message', 'failed')
 
     def store_requests_status(self, response):
-        "Store off the requests fields for consumption by the calling application."
+        """Store off the requests fields for consumption by the calling application.
+           Return the parsed body, an empty dictionary if it is not a JSON object."""
 
         self.status_code = response.status_code
         self.content = response.content
         try:
-            self.message = json.loads(response.text)['message']
-        except KeyError:
-            self.message = None
+            self.body = json_loads(response.content)
+        except ValueError:
+            self.body = None
+        if not isinstance(self.body, dict):
+            self.body = {}
+        self.message = self.body.get('message')
+
+        return self.body
+
+
+# Worker process state of ProcessIngest, set by process_init
+process_phantom = None
+process_build = None
+process_progress = None
+
+
+def process_init(phantom_host, token, options, build, progress, dedup_path=None, dedup_ttl=DEDUP_TTL):
+    "Run in each worker process of ProcessIngest, create its PhantomIngest, with its own session and DedupCache"
+
+    global process_phantom, process_build, process_progress
+    if dedup_path:
+        options = dict(options, dedup=DedupCache(path=dedup_path, ttl=dedup_ttl))
+    process_phantom = PhantomIngest(phantom_host, token, **options)
+    process_build = build
+    process_progress = progress
+
+
+def process_chunk(records, batch_size):
+    "Run in a worker process of ProcessIngest, build the containers of the records and send them"
+
+    results = [None] * len(records)
+    containers = []                                        # (index, container) of the records built
+    for index, record in enumerate(records):
+        try:
+            container = process_build(record)
+        except Exception as e:
+            results[index] = dict(id=None, artifact_ids=[], errors=["build: %s" % e])
+            continue
+        if container is not None:
+            containers.append((index, container))
+
+    created = process_phantom.bulk_ingest([container for _, container in containers], batch_size)
+    for (index, _), result in zip(containers, created):
+        results[index] = result
+
+    with process_progress.get_lock():
+        process_progress.value += len(records)
+    return results
+
+
+class ProcessIngest(object):
+    """Build and send containers in a pool of worker processes, so that building CPU heavy artifacts is not limited
+       to one core by the GIL. Each worker has its own PhantomIngest, and so its own pool of connections.
+
+       build is called in the worker processes with each record, and returns a container, as an item of
+       PhantomIngest.bulk_ingest, or None to skip the record. It must be a function defined at the top level of a
+       module, so that it can be pickled. options are passed to PhantomIngest, for example workers or spool.
+
+       The options are pickled, so a DedupCache cannot be passed as dedup: with dedup_path, each worker uses a
+       DedupCache of the SQLite database at dedup_path, with dedup_ttl. Containers are not upserted, as the workers
+       do not share their caches of containers and would create a container with the same identifier each."""
+
+    def __init__(self, phantom_host, token, build, processes=None, chunk_size=PROCESS_CHUNK_SIZE, dedup_path=None,
+                 dedup_ttl=DEDUP_TTL, **options):
+        if 'dedup' in options:
+            raise ValueError("a DedupCache cannot be passed to the worker processes, use dedup_path")
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+        self.progress = multiprocessing.Value('l', 0)      # records processed by all the workers
+        self.pool = multiprocessing.Pool(self.processes, process_init,
+                                         (phantom_host, token, options, build, self.progress, dedup_path, dedup_ttl))
+
+    def ingest(self, records, batch_size=BULK_BATCH_SIZE):
+        """Generator which yields the result of each record, in the order of the records, as the results of
+           bulk_ingest; None if build skipped the record. Records are sent to the workers in chunks, with up to
+           two chunks for each worker outstanding, so records are read from the iterable only as fast as they
+           are sent."""
+
+        pending = deque()
+        for chunk in PhantomIngest.batches(records, self.chunk_size):
+            pending.append(self.pool.apply_async(process_chunk, (chunk, batch_size)))
+            if len(pending) >= 2 * self.processes:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+
+    def close(self):
+        "Wait for the workers to finish and stop them"
+
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
 
-        return
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+            self.pool.join()
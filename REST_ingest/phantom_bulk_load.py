@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+
+   phantom_bulk_load.py
+
+   Stream events from a file, or stdin, into Phantom containers and artifacts using the PhantomIngest class.
+
+   Copyright (c) 2020 World Wide Technology, LLC
+   All rights reserved.
+
+   author: joel.king@wwt.com
+
+   Revision history:
+     18 Oct 2026  |  initial release
+     18 Oct 2026  |  --spool replays the spool at the end, reports the objects still spooled
+
+   Usage:
+
+       python ./phantom_bulk_load.py --host phantom.example.net --mapping mapping.json events.ndjson
+       zcat firewall.log.gz | python ./phantom_bulk_load.py --format cef --mapping cef.json --rate 500 -
+       python ./phantom_bulk_load.py --format csv --mapping mapping.json --dry-run events.csv
+
+   The token is read from the PHANTOM_TOKEN environment variable, or prompted for.
+
+   Each input record, a line of NDJSON, a row of CSV (the first row names the fields) or a CEF syslog line, becomes
+   one artifact. The mapping file is JSON:
+
+       {"container": {"name": "{deviceVendor} {name}", "source_data_identifier": "{deviceVendor}-{src}"},
+        "artifact": {"name": "{name}", "source_data_identifier": "{externalId}",
+                     "cef": {"sourceAddress": "src", "destinationAddress": "dst"},
+                     "data": ["msg"]}}
+
+   String values of the container and artifact fields are templates, {field} is replaced by the field of the record
+   (empty if the record has no such field). "cef" maps each CEF field to the name of a field of the record, and "data"
+   lists the fields of the record to keep as the artifact data, "*" for all. Records of a chunk which map to the same
+   container fields are added to one container; with --upsert, to the open container with the same
+   source_data_identifier, or name, across chunks and runs.
+
+   The records are read and sent in chunks, so memory is bounded however large the input.
+
+   With --spool, containers and artifacts which cannot be sent while Phantom is unavailable are written to the spool
+   and the load continues. The spool is replayed at the end; what is still spooled is sent by the next run with the
+   same --spool.
+"""
+from __future__ import print_function
+
+import argparse
+import csv
+import getpass
+import json
+import os
+import re
+import string
+import sys
+import time
+from collections import OrderedDict
+
+import PhantomIngest as ingest
+
+CHUNK_SIZE = 2000                                          # records read and sent together
+MAX_ERRORS_SHOWN = 10
+
+try:
+    STRING_TYPES = (str, unicode)
+except NameError:                                          # Python 3
+    STRING_TYPES = (str,)
+
+CEF_HEADER = ("version", "deviceVendor", "deviceProduct", "deviceVersion", "signatureId", "name", "severity")
+CEF_EXTENSION = re.compile(r"([\w.\[\]]+)=((?:\\=|[^=])*?)(?=\s+[\w.\[\]]+=|\s*$)")
+
+
+class Template(dict):
+    "Format mapping which returns an empty string for a field the record does not have"
+
+    def __missing__(self, key):
+        return ""
+
+
+def read_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield row
+
+
+def read_cef(stream):
+    "Parse CEF lines, with or without a syslog prefix; the header fields are named as in CEF_HEADER"
+
+    for line in stream:
+        start = line.find("CEF:")
+        if start < 0:
+            continue
+        fields = re.split(r"(?<!\\)\|", line[start + 4:].rstrip("\r\n"), len(CEF_HEADER))
+        if len(fields) <= len(CEF_HEADER):
+            fields.append("")
+        record = dict((name, unescape(value)) for name, value in zip(CEF_HEADER, fields))
+        for key, value in CEF_EXTENSION.findall(fields[-1]):
+            record[key] = unescape(value.strip())
+        yield record
+
+
+def unescape(value):
+    return re.sub(r"\\(.)", lambda match: {"n": "\n", "r": "\r"}.get(match.group(1), match.group(1)), value)
+
+
+READERS = {"ndjson": read_ndjson, "csv": read_csv, "cef": read_cef}
+
+
+def render(template, record):
+    "Return the template with each string value formatted with the fields of the record"
+
+    if isinstance(template, dict):
+        return dict((key, render(value, record)) for key, value in template.items())
+    if isinstance(template, list):
+        return [render(value, record) for value in template]
+    if isinstance(template, STRING_TYPES):
+        return string.Formatter().vformat(template, (), record)
+    return template
+
+
+def map_chunk(records, mapping):
+    "Return the containers, with their artifacts, for a chunk of records"
+
+    containers = OrderedDict()
+    for record in records:
+        fields = Template(record)
+        container = render(mapping.get("container", {}), fields)
+
+        artifact = render(dict((key, value) for key, value in mapping.get("artifact", {}).items()
+                               if key not in ("cef", "data")), fields)
+        artifact["cef"] = dict((cef, record[field]) for cef, field in mapping.get("artifact", {}).get("cef", {}).items()
+                               if record.get(field) not in (None, ""))
+        data = mapping.get("artifact", {}).get("data", [])
+        artifact["data"] = dict(record) if data == "*" else dict((field, record.get(field)) for field in data)
+
+        key = json.dumps(container, sort_keys=True)
+        containers.setdefault(key, dict(container, artifacts=[]))["artifacts"].append(artifact)
+    return list(containers.values())
+
+
+def paced(records, rate):
+    "Generator which yields the records no faster than rate per second"
+
+    started = time.time()
+    for count, record in enumerate(records):
+        delay = started + float(count) / rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        yield record
+
+
+def chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream events from a file or stdin into Phantom")
+    parser.add_argument("input", nargs="?", default="-", help="file to read, - for stdin")
+    parser.add_argument("--format", choices=sorted(READERS), default="ndjson", help="input format")
+    parser.add_argument("--mapping", required=True, help="JSON file mapping record fields to containers and artifacts")
+    parser.add_argument("--host", help="Phantom host name or address")
+    parser.add_argument("--dry-run", action="store_true", help="print the containers as NDJSON rather than sending them")
+    parser.add_argument("--rate", type=float, help="records per second, the most to read")
+    parser.add_argument("--upsert", action="store_true", help="add to open containers with the same identifier")
+    parser.add_argument("--workers", type=int, default=ingest.BULK_WORKERS, help="concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=ingest.BULK_BATCH_SIZE, help="objects in each list POST")
+    parser.add_argument("--spool", help="SQLite file to spool objects to while Phantom is unavailable")
+    args = parser.parse_args()
+
+    if not (args.dry_run or args.host):
+        parser.error("--host is required unless --dry-run")
+
+    with open(args.mapping) as mapping_file:
+        mapping = json.load(mapping_file)
+
+    phantom = None
+    if not args.dry_run:
+        token = os.environ.get("PHANTOM_TOKEN") or getpass.getpass("Phantom token: ")
+        phantom = ingest.PhantomIngest(args.host, token, workers=args.workers, spool=args.spool)
+        phantom.latencies = []
+
+    stream = sys.stdin if args.input == "-" else open(args.input)
+    records = READERS[args.format](stream)
+    if args.rate:
+        records = paced(records, args.rate)
+
+    counts = dict(records=0, containers=0, artifacts=0, errors=0, spooled=0)
+    errors = []
+    started = time.time()
+    try:
+        for chunk in chunks(records, CHUNK_SIZE):
+            counts["records"] += len(chunk)
+            containers = map_chunk(chunk, mapping)
+            if args.dry_run:
+                for container in containers:
+                    print(json.dumps(container, sort_keys=True))
+                counts["containers"] += len(containers)
+                counts["artifacts"] += len(chunk)
+                continue
+
+            for result in phantom.bulk_ingest(containers, batch_size=args.batch_size, upsert=args.upsert):
+                counts["containers"] += (result["id"] or 0) > 0   # a spooled container has a negative id
+                counts["artifacts"] += sum(artifact_id is not None for artifact_id in result["artifact_ids"])
+                counts["errors"] += len(result["errors"])
+                errors.extend(result["errors"][:MAX_ERRORS_SHOWN - len(errors)])
+
+        if phantom and phantom.spool is not None:
+            phantom.replay(batch_size=args.batch_size)
+            counts["spooled"] = len(phantom.spool)
+            counts["errors"] += len(phantom.spool_errors)
+            errors.extend(error for record, error in phantom.spool_errors[:MAX_ERRORS_SHOWN - len(errors)])
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if phantom:
+            phantom.close()
+
+    elapsed = max(time.time() - started, 1e-6)
+    latencies = phantom.latencies if phantom else []
+    for error in errors:
+        print("error: %s" % error, file=sys.stderr)
+    print("records %s, containers %s, artifacts %s, errors %s, spooled %s in %.1f seconds" % (
+          counts["records"], counts["containers"], counts["artifacts"], counts["errors"], counts["spooled"], elapsed),
+          file=sys.stderr)
+    print("%.1f records/s, %.1f objects/s, %s requests, latency p50 %.3f p95 %.3f seconds" % (
+          counts["records"] / elapsed, (counts["containers"] + counts["artifacts"]) / elapsed, len(latencies),
+          percentile(latencies, 0.5), percentile(latencies, 0.95)), file=sys.stderr)
+    return 1 if counts["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
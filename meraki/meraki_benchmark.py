@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+     Copyright (c) 2020 World Wide Technology, LLC.
+     All rights reserved.
+
+     Revision history:
+     18 Oct   2026  |  1.0 - initial release
+     18 Oct   2026  |  1.1 - clients are returned only if seen within the timespan, adaptive scenario
+
+     module: meraki_benchmark.py
+     author: Joel W. King, World Wide Technology
+     short_description: Offline benchmark of the Meraki connector against a synthetic dashboard
+
+     Usage (from this directory, on a Phantom server so the phantom modules can be imported):
+
+         python2.7 ./meraki_benchmark.py                      # run all scenarios
+         python2.7 ./meraki_benchmark.py --only locate_large  # run one scenario
+
+     For each scenario a local HTTP server is started which mimics the dashboard API: it generates organizations,
+     networks, templates, devices and clients, sleeps to simulate latency, and returns 429 with a Retry-After header
+     when the calls per second exceed the dashboard rate limit. The real connector is run in a child process, with
+     the dashboard asset setting pointing at the local server, and the wall time, API calls, 429s and peak memory
+     (maximum resident set size) of the child are reported.
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+from urlparse import urlparse, parse_qsl
+
+SCENARIOS = [                                              # run in this order, locate_mac uses the index built by locate_large
+    dict(name="locate_small", orgs=1, networks=5, devices=4, clients=20, latency=0.05, dashboard_rate=10,
+         action="locate device", parameters=dict(search_string="*", timespan=86400, refresh_cache=True),
+         config={"rate_limit": 10, "concurrency": 4}),
+    dict(name="locate_large", orgs=1, networks=25, devices=10, clients=40, latency=0.05, dashboard_rate=10,
+         action="locate device", parameters=dict(search_string="*", timespan=86400, refresh_cache=True),
+         config={"rate_limit": 10, "concurrency": 8}),
+    dict(name="locate_mac", orgs=1, networks=25, devices=10, clients=40, latency=0.05, dashboard_rate=10,
+         action="locate device", parameters=dict(search_string="02:00:00:00:00:2a", timespan=86400),
+         config={"rate_limit": 10, "concurrency": 8}),
+    dict(name="locate_pattern", orgs=1, networks=25, devices=10, clients=40, latency=0.05, dashboard_rate=10,
+         action="locate device", parameters=dict(search_string="/^host-1[0-9]$/", timespan=86400, refresh_cache=True),
+         config={"rate_limit": 10, "concurrency": 8}),
+    dict(name="locate_adaptive", orgs=1, networks=25, devices=10, clients=40, latency=0.05, dashboard_rate=10,
+         action="locate device", parameters=dict(search_string="02:00:00:00:02:8e", timespan=86400, refresh_cache=True,
+                                                 adaptive=True),
+         config={"rate_limit": 10, "concurrency": 8}),
+    dict(name="locate_throttled", orgs=1, networks=10, devices=5, clients=20, latency=0.05, dashboard_rate=3,
+         action="locate device", parameters=dict(search_string="*", timespan=86400, refresh_cache=True),
+         config={"rate_limit": 10, "concurrency": 4}),
+    dict(name="bind_batch", orgs=3, networks=50, devices=1, clients=0, latency=0.05, dashboard_rate=10,
+         action="bind network", parameters=dict(network="net-1-3,net-1-7,net-2-11,net-2-40", template="quarantine",
+                                                refresh_cache=True),
+         config={"rate_limit": 10, "concurrency": 4}),
+]
+
+
+# ========================================================
+# Synthetic dashboard
+# ========================================================
+
+
+class Dashboard(object):
+    """
+    The organizations, networks, templates, devices and clients served by the fake dashboard, and the counters.
+    """
+
+    def __init__(self, orgs, networks, devices, clients, latency=0.0, dashboard_rate=10, seed=1, **kwargs):
+        self.latency = latency
+        self.dashboard_rate = dashboard_rate
+        self.lock = threading.Lock()
+        self.recent = []                                   # time of the calls in the last second
+        self.calls = 0
+        self.rate_limited = 0
+
+        rand = random.Random(seed)
+        mac = iter(xrange(1, 1 << 40))
+        self.organizations = [dict(id=str(500000 + o), name="org-%s" % o) for o in range(orgs)]
+        self.networks = {}
+        self.templates = {}
+        self.devices = {}
+        self.clients = {}
+        self.last_seen = {}                                # seconds since each client id was last seen
+        for org in self.organizations:
+            self.templates[org['id']] = [dict(id="L_%s_%s" % (org['id'], name), name=name) for name in ("base", "quarantine")]
+            self.networks[org['id']] = []
+            for n in range(networks):
+                network = dict(id="N_%s_%s" % (org['id'], n), name="net-%s-%s" % (org['name'].split("-")[1], n),
+                               organizationId=org['id'], configTemplateId=self.templates[org['id']][0]['id'])
+                self.networks[org['id']].append(network)
+                self.devices[network['id']] = []
+                for d in range(devices):
+                    serial = "Q2%02d-%04d-%04d" % (int(org['id']) % 100, n, d)
+                    self.devices[network['id']].append(dict(serial=serial, name="dev-%s" % serial, model="MS220-8P"))
+                    self.clients[serial] = []
+                    for _ in range(clients):
+                        address = mac.next()
+                        self.last_seen["k%x" % address] = rand.randint(0, 86400)
+                        self.clients[serial].append(dict(
+                            id="k%x" % address,
+                            mac=":".join("%02x" % b for b in [2] + [(address >> s) & 0xff for s in (32, 24, 16, 8, 0)]),
+                            description="host-%s" % address if rand.random() > 0.2 else None,
+                            dhcpHostname="host-%s" % address, ip="10.%s.%s.%s" % (n % 256, d % 256, address % 254 + 1),
+                            switchport=str(rand.randint(1, 8)), vlan=rand.choice((10, 20, 30)),
+                            usage=dict(sent=rand.random() * 1e6, recv=rand.random() * 1e6)))
+
+    def admit(self):
+        """
+        Count the call, return False if it exceeds the dashboard rate limit in the last second.
+        """
+        with self.lock:
+            now = time.time()
+            self.calls += 1
+            self.recent = [t for t in self.recent if now - t < 1.0]
+            if len(self.recent) >= self.dashboard_rate:
+                self.rate_limited += 1
+                return False
+            self.recent.append(now)
+            return True
+
+
+class DashboardHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve the subset of the v0 API used by the connector.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        content = json.dumps(body) if body is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def dispatch(self):
+        dashboard = self.server.dashboard
+        if self.headers.get("Content-Length"):
+            self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(dashboard.latency)
+        if not dashboard.admit():
+            return self.reply(429, dict(errors=["Too many requests"]), {"Retry-After": "1"})
+
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        path = url.path.split("/")[3:]                     # strip /api/v0
+
+        if self.command == "POST" and len(path) == 3 and path[0] == "networks" and path[2] in ("bind", "unbind"):
+            return self.reply(200, {})
+        if path == ["organizations"]:
+            return self.reply(200, dashboard.organizations)
+        if len(path) == 3 and path[0] == "organizations" and path[2] == "configTemplates":
+            return self.reply(200, dashboard.templates.get(path[1], []))
+        if len(path) == 3 and path[0] == "organizations" and path[2] == "networks":
+            return self.paginate(dashboard.networks.get(path[1], []), query)
+        if len(path) == 3 and path[0] == "networks" and path[2] == "devices":
+            return self.reply(200, dashboard.devices.get(path[1], []))
+        if len(path) == 3 and path[0] == "devices" and path[2] == "clients":
+            timespan = int(query.get("timespan", 86400))
+            return self.reply(200, [client for client in dashboard.clients.get(path[1], [])
+                                    if dashboard.last_seen[client["id"]] <= timespan])
+        return self.reply(404, dict(errors=["Not found"]))
+
+    def paginate(self, items, query):
+        """
+        Return one page of items, with a Link header rel=next if there are more.
+        """
+        per_page = int(query.get("perPage", 1000))
+        start = int(query.get("startingAfter", 0))
+        headers = {}
+        if start + per_page < len(items):
+            headers["Link"] = "<http://%s%s?perPage=%s&startingAfter=%s>; rel=next" % (self.headers["Host"],
+                              urlparse(self.path).path, per_page, start + per_page)
+        return self.reply(200, items[start:start + per_page], headers)
+
+    do_GET = dispatch
+    do_POST = dispatch
+
+
+class DashboardServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, dashboard):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), DashboardHandler)
+        self.dashboard = dashboard
+
+
+# ========================================================
+# Benchmark
+# ========================================================
+
+
+def run_connector(scenario, port):
+    """
+    Run in the child process: execute the action with the real connector and return the measurements.
+    """
+    from meraki_connector import Meraki_Connector
+
+    config = {"Meraki-API-Key": "benchmark", "dashboard": "http://127.0.0.1:%s" % port}
+    config.update(scenario.get("config", {}))
+    in_json = {"app_config": None, "asset_id": "benchmark", "config": config, "debug_level": 0,
+               "identifier": scenario["action"], "parameters": [scenario["parameters"]]}
+
+    connector = Meraki_Connector()
+    started = time.time()
+    ret_val = connector._handle_action(json.dumps(in_json), None)
+    elapsed = time.time() - started
+
+    try:
+        message = json.loads(ret_val).get("message")
+    except (TypeError, ValueError, AttributeError):
+        message = None
+
+    return dict(wall=round(elapsed, 3), connector_calls=len(connector.calls),
+                throttle_wait=round(sum(connector.throttle_wait), 3), message=message,
+                peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def run_scenario(scenario):
+    """
+    Run in the parent process: serve the synthetic dashboard while the connector runs in a child process.
+    """
+    dashboard = Dashboard(**scenario)
+    server = DashboardServer(dashboard)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        output = subprocess.check_output([sys.executable, __file__, "--child", scenario["name"], "--port", str(server.server_port)])
+    finally:
+        server.shutdown()
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result.update(name=scenario["name"], dashboard_calls=dashboard.calls, rate_limited=dashboard.rate_limited)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Meraki connector against a synthetic dashboard")
+    parser.add_argument("--only", help="run only the named scenario")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scenarios = dict((scenario["name"], scenario) for scenario in SCENARIOS)
+
+    if args.child:
+        print json.dumps(run_connector(scenarios[args.child], args.port))
+        return
+
+    print "%-18s %9s %8s %6s %10s %12s  %s" % ("scenario", "wall (s)", "calls", "429s", "throttle", "peak RSS KB", "message")
+    for scenario in SCENARIOS:
+        if args.only and scenario["name"] != args.only:
+            continue
+        result = run_scenario(scenario)
+        print "%-18s %9.2f %8s %6s %10.2f %12s  %s" % (result["name"], result["wall"], result["dashboard_calls"],
+                                                      result["rate_limited"], result["throttle_wait"],
+                                                      result["peak_rss_kb"], result["message"])
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,22 @@
      30 April 2017  |  1.8 - Meraki surveillance cameras - a device with no clients
      13 April 2020  |  1.9 - bind network
      20 April 2020  |  2.0 - rate limit logic
+     18 Oct   2026  |  2.1 - concurrent tree walk for locate device
+     18 Oct   2026  |  2.2 - token bucket rate limiter shared by all API calls
+     18 Oct   2026  |  2.3 - persistent inventory cache with TTL and invalidation
+     18 Oct   2026  |  2.4 - client index for MAC and hostname lookups, on poll refresh
+     18 Oct   2026  |  2.5 - pooled requests session, remember the shard host after redirect
+     18 Oct   2026  |  2.6 - stream records from the walk, progress per network, max_results
+     18 Oct   2026  |  2.7 - search string is a list of MACs, OUI prefixes, regexes and substrings
+     18 Oct   2026  |  2.8 - delta mode, report new, changed and departed clients since the last run
+     18 Oct   2026  |  2.9 - bind network accepts a list of networks, binds run concurrently
+     18 Oct   2026  |  3.0 - bind network stops searching once all networks are found, template index
+     18 Oct   2026  |  3.1 - follow Link headers for paginated endpoints
+     18 Oct   2026  |  3.2 - dashboard may be a URL, to test against a local stub server
+     18 Oct   2026  |  3.3 - per call instrumentation and timing report in the action result
+     18 Oct   2026  |  3.4 - compact client records, shared device, network and organization names
+     18 Oct   2026  |  3.5 - adaptive timespan, widen the window only until the client is found
+     18 Oct   2026  |  3.6 - client pages are filtered as they arrive, only the clients kept are held
 
      module: meraki_connector.py
      author: Joel W. King, World Wide Technology
@@ -30,12 +46,406 @@ from phantom.action_result import ActionResult
 #  system imports
 #
 import simplejson as json
+import os
+import re
 import time
 import requests
 import httplib
+from urlparse import urlparse
+import threading
+from itertools import izip
+from multiprocessing.pool import ThreadPool
 
 from meraki_connector_consts import *                  # file name would be ./meraki_connector_consts.py
 
+# ========================================================
+# Rate limiter
+# ========================================================
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket. Each API call takes one token, tokens are replenished at 'rate' per second up to 'burst'.
+    When the bucket is empty, the caller sleeps until the next token is available, so calls are paced proactively
+    rather than reacting to a 429 from the dashboard.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.last = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, sleeping if necessary. Return the number of seconds spent waiting.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1                               # reserve a token, possibly going negative
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """
+        The dashboard returned a 429, empty the bucket so all threads back off for Retry-After seconds.
+        """
+        with self.lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+            self.last = time.time()                        # no refill is credited for the time before the 429
+
+
+# ========================================================
+# Inventory cache
+# ========================================================
+
+
+class InventoryCache(object):
+    """
+    On disk cache of the organization, network, template and device inventory, which changes infrequently.
+    Entries are keyed by API URL and stored with the time they were fetched, an entry older than the TTL for
+    its kind (see CACHE_TTL) is treated as a miss. The cache is a JSON file in the app state directory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.dirty = False
+        try:
+            with open(filename) as f:
+                self.entries = json.load(f)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def get(self, URL, kind):
+        """
+        Return the cached value for URL, or None if not cached or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(URL)
+        if entry and time.time() - entry['fetched'] < CACHE_TTL.get(kind, 0):
+            return entry['value']
+        return None
+
+    def put(self, URL, value):
+        with self.lock:
+            self.entries[URL] = dict(fetched=time.time(), value=value)
+            self.dirty = True
+
+    def invalidate(self, prefix=""):
+        """
+        Remove all entries whose URL begins with prefix, an empty prefix clears the cache.
+        """
+        with self.lock:
+            for URL in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[URL]
+                self.dirty = True
+
+    def save(self):
+        """
+        Write the cache back to disk if it has changed, write to a temporary file and rename so a reader never sees a partial file.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            temp = self.filename + ".tmp"
+            with open(temp, "w") as f:
+                json.dump(self.entries, f)
+            os.rename(temp, self.filename)
+            self.dirty = False
+
+
+# ========================================================
+# Client record
+# ========================================================
+
+
+class ClientRecord(object):
+    """
+    Compact record of a client found by the walk. The device, network and organization names are shared references
+    (see Meraki_Connector.intern_name) rather than a copy in a dictionary for every client. The record is converted to
+    the dictionary added to the Action Result data field by as_dict().
+    """
+    __slots__ = ("mac", "description", "device", "network", "organization", "change")
+
+    def __init__(self, mac, description, device, network, organization, change=None):
+        self.mac = mac
+        self.description = description
+        self.device = device
+        self.network = network
+        self.organization = organization
+        self.change = change
+
+    def as_dict(self):
+        record = {'client': {'mac': self.mac, 'description': self.description},
+                  'device': self.device, 'network': self.network, 'organization': self.organization}
+        if self.change:
+            record['change'] = self.change
+        return record
+
+    def as_list(self):
+        return [self.mac, self.description, self.device, self.network, self.organization]
+
+
+# ========================================================
+# Client index
+# ========================================================
+
+
+class ClientIndex(object):
+    """
+    Index of the clients found by the last complete walk of the organizations, keyed by normalized MAC address.
+    The records are ClientRecord objects, saved as lists in a JSON file in the app state directory.
+    """
+
+    MAC = re.compile(r"^[0-9a-f]{12}$")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.dirty = False
+        try:
+            with open(filename) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            saved = {}
+        try:
+            clients = dict((mac, [ClientRecord(*record) for record in records]) for mac, records in saved.get("clients", {}).items())
+        except TypeError:                                  # saved by a prior release, records were dictionaries
+            clients = {}
+        self.replace(clients, saved.get("timespan", 0), saved.get("updated", 0))
+        self.dirty = False
+
+    @classmethod
+    def normalize_mac(cls, value):
+        """
+        Return the MAC address in lower case colon notation, or None if value is not a complete MAC address.
+        Accepts 00:18:0a:01:02:03, 00-18-0A-01-02-03 and 0018.0a01.0203
+        """
+        digits = re.sub(r"[:.\-]", "", value.strip().lower())
+        if not cls.MAC.match(digits):
+            return None
+        return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+    @classmethod
+    def add(cls, clients, record):
+        """
+        Add a ClientRecord to a dictionary of clients being built by a walk.
+        """
+        mac = cls.normalize_mac(record.mac)
+        if mac:
+            clients.setdefault(mac, []).append(record)
+
+    def replace(self, clients, timespan, updated=None):
+        """
+        Replace the index with the clients from a complete walk using the specified timespan.
+        """
+        self.clients = clients
+        self.timespan = int(timespan)
+        self.updated = time.time() if updated is None else updated
+        self.dirty = True
+
+    def lookup(self, search_string, timespan):
+        """
+        Return the ClientRecords matching a MAC address, or containing the search string in the description or MAC as
+        a walk does, or None when the index cannot answer: a miss, an index older than CLIENT_INDEX_TTL, or a timespan
+        other than the one used to build the index. The index does not know when each client was last seen, so a
+        shorter timespan cannot be answered either.
+        """
+        if not self.clients or time.time() - self.updated > CLIENT_INDEX_TTL or int(timespan) != self.timespan:
+            return None
+
+        mac = self.normalize_mac(search_string)
+        if mac:
+            return self.clients.get(mac)
+
+        records = []
+        for client_records in self.clients.values():
+            records.extend(record for record in client_records
+                           if search_string in record.description or search_string in record.mac)
+        return records or None
+
+    def save(self):
+        """
+        Write the index back to disk if it has changed.
+        """
+        if not self.dirty:
+            return
+        temp = self.filename + ".tmp"
+        with open(temp, "w") as f:
+            clients = dict((mac, [record.as_list() for record in records]) for mac, records in self.clients.items())
+            json.dump(dict(clients=clients, timespan=self.timespan, updated=self.updated), f)
+        os.rename(temp, self.filename)
+        self.dirty = False
+
+
+# ========================================================
+# Client delta
+# ========================================================
+
+
+class ClientDelta(object):
+    """
+    The clients seen on each device serial number within the requested timespan by the delta runs of a search string,
+    when each was last seen, and when the device was polled. Used to report only new, changed and departed clients and
+    to request only the timespan since the last poll. The state of all search strings is one JSON file in the app state
+    directory.
+    """
+
+    FIELDS = ("description", "ip", "vlan", "switchport", "dhcpHostname")
+
+    def __init__(self, filename, search_string):
+        self.filename = filename
+        try:
+            with open(filename) as f:
+                self.saved = json.load(f)
+        except (IOError, ValueError):
+            self.saved = {}
+        self.devices = self.saved.setdefault(search_string, {})
+
+    def timespan(self, serial, timespan):
+        """
+        Return the timespan to request for the device, the time since the last poll plus DELTA_OVERLAP seconds,
+        but never more than the requested timespan.
+        """
+        polled = self.devices.get(serial, {}).get("polled")
+        if polled is None:
+            return timespan
+        return max(1, min(int(timespan), int(time.time() - polled) + DELTA_OVERLAP))
+
+    def update(self, serial, client_list, polled, timespan):
+        """
+        Compare the clients now seen on the device with the saved state, return a list of (client, change) tuples where
+        change is one of 'new', 'changed' or 'departed', and the new state of the device. The client list covers only
+        the time since the last poll, so a saved client which is not in it is kept, and is departed only once it has not
+        been seen for the requested timespan. A departed client is rebuilt from the saved MAC and description. The state
+        is saved by commit, once the changes have been reported.
+        """
+        saved = self.devices.get(serial, {})
+        previous = saved.get("clients", {})
+        previous_seen = saved.get("seen", {})              # absent in the state of a prior release
+        current = {}
+        seen = {}
+        changes = []
+        for client in client_list:
+            fingerprint = [client.get(field) for field in self.FIELDS]
+            current[client.get("mac")] = fingerprint
+            seen[client.get("mac")] = polled
+            if client.get("mac") not in previous:
+                changes.append((client, "new"))
+            elif previous[client.get("mac")] != fingerprint:
+                changes.append((client, "changed"))
+
+        for mac, fingerprint in previous.items():
+            if mac in current:
+                continue
+            last_seen = previous_seen.get(mac, saved.get("polled", polled))
+            if polled - last_seen >= min(int(timespan), MAX_TIMESPAN):
+                changes.append((dict(mac=mac, description=fingerprint[0]), "departed"))
+            else:
+                current[mac] = fingerprint
+                seen[mac] = last_seen
+
+        return changes, dict(polled=polled, clients=current, seen=seen)
+
+    @classmethod
+    def compact(cls, client):
+        """
+        Return only the MAC and the compared fields of the client, all that update needs to be kept of each client.
+        """
+        kept = dict((field, client.get(field)) for field in cls.FIELDS)
+        kept["mac"] = client.get("mac")
+        return kept
+
+    def commit(self, serial, state):
+        """
+        Record the state of the device returned by update.
+        """
+        self.devices[serial] = state
+
+    def save(self):
+        temp = self.filename + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.saved, f)
+        os.rename(temp, self.filename)
+
+
+# ========================================================
+# Search matcher
+# ========================================================
+
+
+class SearchMatcher(object):
+    """
+    Compile the locate device search string once, so a single walk answers many patterns. The search string is a comma
+    separated list of terms, each term is one of:
+
+        *                     everything
+        00:18:0a:01:02:03     a MAC address (any notation), an exact match using a set lookup
+        00:18:0a              an OUI prefix, matched against the first three octets using a set lookup
+        /^printer-\d+$/      a regular expression, searched in the client description and MAC
+        anything else         a substring of the client description or MAC, as in prior releases
+
+    The regular expressions and substrings are combined into a single alternation. An invalid regular expression
+    raises re.error naming the term.
+    """
+
+    TERMS = re.compile(r"\s*(/(?:[^/\\]|\\.)*/|[^,]+)\s*,?")
+    OUI = re.compile(r"^[0-9a-f]{2}([:\-])[0-9a-f]{2}\1[0-9a-f]{2}$")
+
+    def __init__(self, search_string):
+        self.everything = False
+        self.macs = set()
+        self.ouis = set()
+        self.terms = []                                    # MAC and substring terms, these can be answered by the client index
+        self.patterns = []                                 # OUI and regular expression terms, these require a walk
+        alternation = []
+
+        for term in (match.strip() for match in self.TERMS.findall(search_string)):
+            if not term:
+                continue
+            if term == "*":
+                self.everything = True
+            elif len(term) > 1 and term.startswith("/") and term.endswith("/"):
+                try:
+                    re.compile(term[1:-1])
+                except re.error as e:
+                    raise re.error("Invalid regular expression %s: %s" % (term, e))
+                alternation.append("(?:%s)" % term[1:-1])
+                self.patterns.append(term)
+            elif self.OUI.match(term.lower()):
+                self.ouis.add(term.lower().replace("-", ":"))
+                self.patterns.append(term)
+            elif ClientIndex.normalize_mac(term):
+                self.macs.add(ClientIndex.normalize_mac(term))
+                self.terms.append(term)
+            else:
+                alternation.append(re.escape(term))
+                self.terms.append(term)
+
+        self.regex = re.compile("|".join(alternation)) if alternation else None
+        self.exact = bool(self.macs) and not (self.everything or self.ouis or self.regex)
+
+    def match(self, mac, description):
+        """
+        Return True if the client MAC or description matches any of the terms.
+        """
+        if self.everything:
+            return True
+        if self.macs or self.ouis:
+            normalized = ClientIndex.normalize_mac(mac)
+            if normalized in self.macs or (normalized and normalized[:8] in self.ouis):
+                return True
+        if self.regex:
+            return bool(self.regex.search(description) or self.regex.search(mac))
+        return False
+
+
 # ========================================================
 # AppConnector
 # ========================================================
@@ -56,6 +466,16 @@ class Meraki_Connector(BaseConnector):
         self.status_code = []
         self.OK = (200,)
         self.RATE_LIMIT_EXCEEDED = 429
+        self.bucket = None                                 # TokenBucket, created by initialize() from the asset config
+        self.throttle_wait = []                            # seconds each API call waited on the rate limiter
+        self.calls = []                                    # instrumentation record of each API call, see rate_limit()
+        self.names = {}                                    # device, network and organization names shared by ClientRecords
+        self.action_started = (time.time(), 0)             # start time and len(self.calls) when the current action began
+        self.cache = None                                  # InventoryCache, created by initialize()
+        self.index = None                                  # ClientIndex, created by initialize()
+        self.delta = None                                  # ClientDelta, created by locate device in delta mode
+        self.session = None                                # requests.Session, created by get_session()
+        self.shard = None                                  # dashboard host name learned from the first redirect
 
     def initialize(self):
         """
@@ -65,6 +485,10 @@ class Meraki_Connector(BaseConnector):
         If this function returns phantom.APP_ERROR, then AppConnector::handle_action will not get called.
         """
         self.debug_print("%s INITIALIZE %s" % (Meraki_Connector.BANNER, time.asctime()))
+        self.bucket = TokenBucket(self.get_configuration("rate_limit"))
+        self.cache = InventoryCache(os.path.join(self.get_state_dir(), "meraki_inventory_%s.json" % self.get_asset_id()))
+        self.index = ClientIndex(os.path.join(self.get_state_dir(), "meraki_clients_%s.json" % self.get_asset_id()))
+        self.shard = self.cache.get("shard", "shard")
         return phantom.APP_SUCCESS
 
     def finalize(self):
@@ -74,7 +498,16 @@ class Meraki_Connector(BaseConnector):
         multiple handle_action function calls and create any summary if required. Another usage is cleanup, disconnect
         from remote devices etc.
         """
-        self.debug_print("%s FINALIZE Status: %s" % (Meraki_Connector.BANNER, self.get_status()))
+        self.debug_print("%s FINALIZE Status: %s calls: %s throttled: %.2f seconds" % (Meraki_Connector.BANNER, self.get_status(),
+                         len(self.throttle_wait), sum(self.throttle_wait)))
+        if self.session:
+            self.session.close()
+        for state in (self.cache, self.index, self.delta):
+            try:
+                if state:
+                    state.save()
+            except (IOError, OSError) as e:
+                self.debug_print("%s FINALIZE unable to save %s: %s" % (Meraki_Connector.BANNER, state.filename, e))
         return
 
     def handle_exception(self, exception_object):
@@ -100,6 +533,20 @@ class Meraki_Connector(BaseConnector):
             else:
                 return DASHBOARD
 
+        if key == "concurrency":                           # Worker threads used to walk the tree, bounded to avoid 429s
+            try:
+                workers = int(config.get("concurrency", WALK_CONCURRENCY))
+            except (TypeError, ValueError):
+                workers = WALK_CONCURRENCY
+            return max(1, min(workers, MAX_CONCURRENCY))
+
+        if key == "rate_limit":                            # API calls per second, the dashboard enforces this per org
+            try:
+                rate = float(config.get("rate_limit", RL_CALLS_PER_SECOND))
+            except (TypeError, ValueError):
+                rate = RL_CALLS_PER_SECOND
+            return rate if rate > 0 else RL_CALLS_PER_SECOND
+
         return config.get(key)
 
     def _test_connectivity(self, param):
@@ -117,15 +564,15 @@ class Meraki_Connector(BaseConnector):
         """
         self.debug_print("%s TEST_CONNECTIVITY %s" % (Meraki_Connector.BANNER, param))
 
-        header = self.HEADER
-        header["X-Cisco-Meraki-API-Key"] = self.get_configuration("Meraki-API-Key")
-        URI = "https://" + self.get_configuration("dashboard") + "/api/v0/organizations"
+        URI = self.api_url("/api/v0/organizations", use_shard=False)
 
         try:
-            r = requests.get(URI, headers=header, verify=False)
+            r = self.get_session().get(URI)
         except requests.ConnectionError as e:
             return self.set_status_save_progress(phantom.APP_ERROR, str(e))
 
+        self.learn_shard(r)
+
         organizations = ""                                 # It is possible to have multiple organizations per user account
         try:                                               # It is the API Key which determines the orgs this admin owns.
             response = r.json()                            # r.json() provides the results of r.content as a list rather than string
@@ -151,6 +598,23 @@ class Meraki_Connector(BaseConnector):
         an organization can have one or more networks, each network can have multiple devices, and each device can have one or
         more client machines. Depending on the timespan specified, you may see differing results. Larger timespans may show the same
         client connected to multiple devices. Small timespans, may not return any results.
+
+        The devices of each network and the clients of each device are retrieved in parallel by a pool of worker threads,
+        the size of the pool is the 'concurrency' asset setting. Records are returned in the same order as a sequential walk.
+
+        A search for a specific MAC address or hostname is first answered from the client index, the tree is walked
+        only on a miss or when the index is stale. The index is only rebuilt by on poll, see refresh_client_index.
+
+        Records are added to the action result as they are found and progress is reported for each network. If
+        max_results is specified, the walk stops once that many records are found.
+
+        The search string may list many MACs, OUI prefixes, regular expressions and substrings, see SearchMatcher.
+
+        In delta mode only the clients which are new, changed or departed since the last delta run of the same search
+        string are returned, and each device is asked only for the timespan since it was last polled.
+
+        In adaptive mode the devices are first asked for a short timespan, which is widened until a client matches,
+        see adaptive_clients.
         """
         self.debug_print("%s LOCATE_DEVICE parameters:\n%s" % (Meraki_Connector.BANNER, param))
 
@@ -162,19 +626,53 @@ class Meraki_Connector(BaseConnector):
         except KeyError:
             param["search_string"] = "*"
 
-        org_id_list = self.get_org_ids()
-        for organization in org_id_list:
-            networks_list = self.get_networks(organization["id"])
-            for network in networks_list:
-                device_list = self.get_devices(network["id"])
-                for device in device_list:
-                    client_list = self.get_clients(device["serial"], param["timespan"])
-                    for client in client_list:
-                        response = self.build_output_record(param["search_string"], organization, network, device, client)
-                        if response:
-                            action_result.add_data(response)
+        if param.get("refresh_cache"):
+            self.cache.invalidate()
+            self.shard = None
+
+        try:
+            max_results = int(param.get("max_results") or 0)
+        except ValueError:
+            max_results = 0
+
+        try:
+            matcher = SearchMatcher(param["search_string"])
+        except re.error as e:
+            action_result.set_status(phantom.APP_ERROR, str(e))
+            return self.set_status_save_progress(phantom.APP_ERROR, str(e))
+
+        if param.get("delta"):
+            self.delta = ClientDelta(os.path.join(self.get_state_dir(), "meraki_delta_%s.json" % self.get_asset_id()),
+                                     param["search_string"])
+
+        hits = None
+        if not param.get("refresh_cache") and not self.delta:
+            hits = self.index_lookup(matcher, param["timespan"])
 
-        if action_result.get_data_size() > 0:
+        if int(param["timespan"]) > MAX_TIMESPAN:
+            self.save_progress("Timespan limited to %s seconds" % MAX_TIMESPAN)
+
+        if hits is not None:
+            records = iter(hits)
+        elif param.get("adaptive") and not self.delta:
+            records = self.adaptive_clients(param["timespan"], matcher)
+        else:
+            records = self.index_clients(param["timespan"], matcher, self.delta)
+        try:
+            for record in records:
+                action_result.add_data(record.as_dict())
+                if max_results and action_result.get_data_size() >= max_results:
+                    self.save_progress("Reached max_results: %s" % max_results)
+                    break
+        finally:
+            if hits is None:
+                records.close()                            # stop the walk and its worker threads
+
+        timing = self.timing_report()
+        action_result.add_extra_data(dict(timing=timing))
+        action_result.update_summary(dict(api_calls=timing['calls'], throttle_wait=timing['throttle_wait'], index_hit=hits is not None))
+
+        if action_result.get_data_size() > 0 or self.delta:  # in delta mode, no changes is a successful result
             action_result.set_status(phantom.APP_SUCCESS)
             self.set_status_save_progress(phantom.APP_SUCCESS, "Returned: %s clients" % action_result.get_data_size())
         else:
@@ -184,9 +682,188 @@ class Meraki_Connector(BaseConnector):
         self.debug_print("%s Data size: %s" % (Meraki_Connector.BANNER, action_result.get_data_size()))
         return action_result.get_status()
 
-    def build_output_record(self, search_string, organization, network, device, client):
+    def index_lookup(self, matcher, timespan):
+        """
+        Return the records for each MAC and substring term from the client index, or None if any term is a miss or
+        the search includes everything, an OUI or a regular expression, all of which require a walk.
+        """
+        if matcher.everything or matcher.patterns or not matcher.terms:
+            return None
+
+        hits = []
+        for term in matcher.terms:
+            records = self.index.lookup(term, timespan)
+            if records is None:
+                return None
+            hits.extend(record for record in records if record not in hits)
+        return hits
+
+    def refresh_client_index(self, param):
+        """
+        Scheduled by the asset ingest settings (on poll), walk all organizations to rebuild the client index in the
+        background so locate device can answer from the index. The index is replaced only if every API call of the
+        walk succeeded, an incomplete index would answer lookups with partial results.
+        """
+        self.debug_print("%s REFRESH_CLIENT_INDEX parameters:\n%s" % (Meraki_Connector.BANNER, param))
+
+        mark = len(self.calls)
+        clients = {}
+        for record in self.index_clients(CLIENT_INDEX_TIMESPAN):
+            ClientIndex.add(clients, record)
+
+        failed = len([record for record in self.calls[mark:] if record['status'] not in self.OK])
+        if failed:
+            return self.set_status_save_progress(phantom.APP_ERROR, "Index not replaced: %s API calls failed" % failed)
+
+        self.index.replace(clients, CLIENT_INDEX_TIMESPAN)
+        return self.set_status_save_progress(phantom.APP_SUCCESS, "Indexed: %s clients" % len(self.index.clients))
+
+    def index_clients(self, timespan, matcher=SearchMatcher("*"), delta=None):
+        """
+        Generator which walks the tree and yields a ClientRecord for each client matching the search terms. A progress
+        message with the count of clients and matches is sent as the walk finishes each network.
+
+        With a ClientDelta, only new, changed and departed clients are matched and their records include the change.
+        The state of a device is kept if its clients could not be retrieved, and is only updated once all its changes
+        are yielded.
+
+        If the caller stops iterating, closing the generator terminates the worker threads.
+        """
+        counts = dict(network=None, clients=0, matched=0, total=0)
+        started = time.time()
+        keep = ClientDelta.compact if delta else self.matching(matcher)
+        pool = ThreadPool(self.get_configuration("concurrency"))
+        try:
+            for organization, network, device, client_list, count in self.walk_clients(pool, timespan, keep, delta):
+                if network is not counts["network"]:
+                    self.network_progress(counts)
+                    counts.update(network=network, clients=0, matched=0)
+
+                state = None
+                if client_list is None:                    # delta mode, the clients could not be retrieved
+                    self.send_progress("Device %s: clients not retrieved" % device.get("serial"))
+                    client_list, changes = [], []
+                elif delta:
+                    changes, state = delta.update(device["serial"], client_list, started, timespan)
+                else:
+                    changes = [(client, None) for client in client_list]
+                counts["clients"] += count
+
+                for client, change in changes:
+                    response = self.build_output_record(matcher, organization, network, device, client)
+                    if response:
+                        counts["matched"] += 1
+                        counts["total"] += 1
+                        response.change = change
+                        yield response
+
+                if state is not None:                      # all the changes of the device have been reported
+                    delta.commit(device["serial"], state)
+
+            self.network_progress(counts)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def adaptive_clients(self, timespan, matcher):
+        """
+        Generator which yields a ClientRecord for each client matching the search terms, asking the devices for each
+        timespan of ADAPTIVE_TIMESPANS shorter than the requested timespan, then the requested timespan. The inventory
+        is walked once. If the search is only for MAC addresses, the windows are widened until all of them are found,
+        and the walk stops as soon as they are; otherwise the larger windows are not requested after a window in which
+        any client matched. Clients found in a window are not reported again by a larger window. The client index is
+        not updated.
+        """
+        windows = [window for window in ADAPTIVE_TIMESPANS if window < int(timespan)] + [timespan]
+        reported = set()
+        pool = ThreadPool(self.get_configuration("concurrency"))
+        try:
+            inventory = list(self.walk_devices(pool))
+            for window in windows:
+                devices = matched = 0
+                for organization, network, device, client_list, count in self.fetch_clients(pool, inventory, window,
+                                                                                            self.matching(matcher)):
+                    devices += 1
+                    for client in client_list:
+                        response = self.build_output_record(matcher, organization, network, device, client)
+                        if response and (device['serial'], response.mac) not in reported:
+                            reported.add((device['serial'], response.mac))
+                            matched += 1
+                            yield response
+                    if matcher.exact and matcher.macs.issubset(ClientIndex.normalize_mac(mac) for serial, mac in reported):
+                        self.send_progress("Timespan %s seconds: found all MAC addresses" % window)
+                        return
+
+                self.send_progress("Timespan %s seconds: %s devices, %s matched" % (window, devices, matched))
+                if matched and not matcher.exact:
+                    return
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def network_progress(self, counts):
+        """
+        Report the clients found and matched in the network just walked, and the running total of matches.
+        """
+        if counts["network"] is None:
+            return
+        self.send_progress("Network %s: %s clients, %s matched, %s matched in total" % (counts["network"].get("name"),
+                           counts["clients"], counts["matched"], counts["total"]))
+
+    def walk_clients(self, pool, timespan, keep=None, delta=None):
+        """
+        Generator which walks organizations, networks and devices, yielding the clients kept of each device, see
+        fetch_clients. For each
+        organization, the device lists for all networks are fetched concurrently, then the client lists of all those
+        devices are fetched concurrently. pool.map and pool.imap preserve the input order, so tuples are yielded in the
+        same order as the nested sequential loops; imap yields each client list as soon as it and its predecessors arrive.
+        With a ClientDelta, each device is asked only for the timespan since its last poll.
+        """
+        return self.fetch_clients(pool, self.walk_devices(pool), timespan, keep, delta)
+
+    def walk_devices(self, pool):
+        """
+        Generator which yields each organization and a list of (network, device) for all devices in the organization.
+        The device lists of the networks are fetched concurrently.
+        """
+        for organization in self.get_org_ids():
+            networks_list = self.get_networks(organization["id"])
+            device_lists = pool.map(lambda network: self.get_devices(network["id"]), networks_list)
+
+            work = []                                      # (network, device) pairs for this organization
+            for network, device_list in zip(networks_list, device_lists):
+                for device in device_list:
+                    work.append((network, device))
+
+            yield organization, work
+
+    def fetch_clients(self, pool, inventory, timespan, keep=None, delta=None):
         """
-        Match the search string against the client MAC and description, if there is a match return a dictionary to add to
+        Generator which fetches the clients of the devices of each organization of the inventory concurrently,
+        yielding organization, network, device, the list of clients kept and the count of clients in inventory order.
+        The worker threads call keep with each client as its page arrives, see get_clients, so the lists waiting to be
+        yielded hold only what is kept. With a ClientDelta, the client list is None if the clients of the device could
+        not be retrieved, rather than an empty list.
+        """
+        for organization, work in inventory:
+            if delta:
+                client_lists = pool.imap(lambda item: self.get_clients(item[1]["serial"], delta.timespan(item[1]["serial"], timespan), keep, none_on_error=True), work)
+            else:
+                client_lists = pool.imap(lambda item: self.get_clients(item[1]["serial"], timespan, keep), work)
+
+            for (network, device), (client_list, count) in izip(work, client_lists):
+                yield organization, network, device, client_list, count
+
+    @staticmethod
+    def matching(matcher):
+        """
+        Return a keep function for fetch_clients which keeps the clients matching the search terms.
+        """
+        return lambda client: client if matcher.match(client.get('mac') or '', client.get('description') or '') else None
+
+    def build_output_record(self, matcher, organization, network, device, client):
+        """
+        Match the search terms against the client MAC and description, if there is a match return a ClientRecord for
         the Action Result data field. A search string of "*" means to return everything.
         """
 
@@ -195,78 +872,141 @@ class Meraki_Connector(BaseConnector):
         if client.get('description') is None:              # Description could be NoneType
             client['description'] = ""
 
-        if search_string == "*" or search_string in client['description'] or search_string in client['mac']:
-            return {'client': {'mac': client.get('mac', ''), 'description': client.get('description', '')},
-                'device': device.get('name', ''), 'network': network.get('name', ''), 'organization': organization.get('name', '')}
+        if matcher.match(client.get('mac', ''), client['description']):
+            return self.output_record(organization, network, device, client)
         return None
 
+    def output_record(self, organization, network, device, client):
+        """
+        Return the ClientRecord for a client, the names are shared with all other clients of the same device, network
+        and organization.
+        """
+        return ClientRecord(client.get('mac', ''), client.get('description') or '', self.intern_name(device.get('name', '')),
+                            self.intern_name(network.get('name', '')), self.intern_name(organization.get('name', '')))
+
+    def intern_name(self, name):
+        """
+        Return the one shared copy of the name. The JSON decoder returns unicode, which intern() does not accept.
+        """
+        return self.names.setdefault(name, name)
+
     def bind_network(self, param):
         """
-        Bind a network to a template
+        Bind a network to a template. The network parameter may be a comma separated list of network names, all are
+        resolved from one fetch of the inventory and the unbind / bind calls for each network are issued concurrently
+        by the worker threads, subject to the rate limiter. One record is returned for each network.
         """
         self.debug_print("%s BIND NETWORK parameters:\n%s" % (Meraki_Connector.BANNER, param))
 
         action_result = ActionResult(dict(param))          # Add an action result to the App Run
         self.add_action_result(action_result)
 
-        target_network = {}
+        if param.get("refresh_cache"):
+            self.cache.invalidate()
+            self.shard = None
+
+        names = []                                         # requested network names, without duplicates, in order
+        for name in (name.strip() for name in param.get('network', '').split(',')):
+            if name and name not in names:
+                names.append(name)
+        target_networks = {}                               # key=network name, value=network
         templates = {}                                     # key=org_id, value= list of templates
+        template_index = {}                                # key=org_id, value= templates indexed by name and id
 
-        orgs = self.get_org_ids()
-        for organization in orgs:
-            templates[organization['id']] = self.get_templates(organization['id'])
-            networks = self.get_networks(organization['id'])
-            for network in networks:
-                if param.get('network') == network.get('name'):
-                    target_network = network
-                    break
+        # Search the organizations only until all the requested networks are found
+
+        remaining = set(names)
+        for organization in self.get_org_ids():
+            if not remaining:
+                break
+            networks = dict((network.get('name'), network) for network in self.get_networks(organization['id'], cached=False))
+            for name in remaining.intersection(networks):
+                target_networks[name] = networks[name]
+            remaining.difference_update(networks)
+
+        # Templates are only needed for the organizations which contain a requested network
+
+        for org_id in set(network['organizationId'] for network in target_networks.values()):
+            templates[org_id] = self.get_templates(org_id)
+            template_index[org_id] = self.index_templates(templates[org_id])
+
+        pool = ThreadPool(self.get_configuration("concurrency"))
+        try:
+            results = pool.map(lambda name: self.bind_template(name, target_networks.get(name), param.get('template'), template_index), names)
+        finally:
+            pool.close()
+            pool.join()
+
+        for record in results:
+            action_result.add_data(record)
+        action_result.add_extra_data(dict(templates=templates))
+        action_result.add_extra_data(dict(timing=self.timing_report()))
+
+        bound = len([record for record in results if record['status'] == "success"])
+        if names and bound == len(names):
+            action_result.set_status(phantom.APP_SUCCESS)
+            return self.set_status_save_progress(phantom.APP_SUCCESS, "Bound template to %s network(s)" % bound)
+
+        action_result.set_status(phantom.APP_ERROR)
+        return self.set_status_save_progress(phantom.APP_ERROR, "Bound template to %s of %s network(s)" % (bound, len(names)))
+
+    def bind_template(self, name, target_network, template_name, template_index):
+        """
+        Unbind the network from its current template, if bound, and bind it to the requested template.
+        Return a dictionary with the details and the status ('success' or 'failed') and message for this network.
+        """
+        results = dict(requested=dict(name=template_name), target=dict(name=name), status="failed")
 
         # Verfiy we have found the requested network
 
         if not target_network:
-            return self.set_status_save_progress(phantom.APP_ERROR, "Network not found!")
+            results['message'] = "Network not found!"
+            return results
 
         # Templates are specific to an Org
 
-        requested_template = {}
-        for template in templates[target_network['organizationId']]:
-            if param.get('template') == template['name']:
-                 requested_template = template
-                 break
+        requested_template = template_index[target_network['organizationId']]['name'].get(template_name)
 
         # Did we located the template in the Org which contains the network?
 
         if not requested_template:
-            return self.set_status_save_progress(phantom.APP_ERROR, "Requested template not found!")
+            results['message'] = "Requested template not found!"
+            return results
+
+        results['requested'] = dict(id=requested_template['id'],
+                                    name=requested_template['name'])
+        results['target'] = dict(id=target_network['id'],
+                                 name=target_network['name'],
+                                 org=target_network['organizationId'],
+                                 template_id=target_network.get('configTemplateId'),
+                                 template_name=self.get_template_name(template_index[target_network['organizationId']], target_network.get('configTemplateId')))
 
         # First, you must unbind the existing template, if bound (if not bound, API returns 400 Network is not bound )
 
         if target_network.get('configTemplateId'):
             if not self.post_api('/api/v0/networks/' + target_network['id'] + '/unbind'):
-                return self.set_status_save_progress(phantom.APP_ERROR, "Failure unbinding network from template!")
+                results['message'] = "Failure unbinding network from template!"
+                return results
 
-            self.set_status_save_progress(phantom.APP_SUCCESS, "Unbound template from network.")
+            self.save_progress("Unbound template from network %s." % name)
 
         # Then, apply the requested template ID to the target network
 
         payload = {'configTemplateId': requested_template['id']}
 
-        if not self.post_api('/api/v0/networks/{}/bind'.format(target_network['id']), body=payload):
-            return self.set_status_save_progress(phantom.APP_ERROR, "Failed to bind the template: {}".format(payload))
+        bound = self.post_api('/api/v0/networks/{}/bind'.format(target_network['id']), body=payload)
 
-        # Report back to user pertaintent details
+        # The configTemplateId of the network has changed (or is unknown if the bind failed), discard the cached networks
 
-        results = dict(requested=dict(id=requested_template['id'],
-                                      name=requested_template['name']),
-                       target=dict(id=target_network['id'],
-                                   name=target_network['name'],
-                                   org=target_network['organizationId'],
-                                   template_id=target_network.get('configTemplateId'),
-                                   template_name=self.get_template_name(templates[target_network['organizationId']], target_network.get('configTemplateId'))))
+        self.cache.invalidate("/api/v0/organizations/" + str(target_network['organizationId']) + "/networks")
 
-        action_result.add_data(results)
-        action_result.add_extra_data(dict(templates=templates))
-        action_result.set_status(phantom.APP_SUCCESS)
+        if not bound:
+            results['message'] = "Failed to bind the template: {}".format(payload)
+            return results
+
+        results['status'] = "success"
+        results['message'] = "Bound template to network."
+        return results
 
     def get_org_ids(self):
         """
@@ -274,7 +1014,7 @@ class Meraki_Connector(BaseConnector):
         URI = "https://dashboard.meraki.com/api/v0/organizations"
         return [{"id":530205,"name":"WWT"}]
         """
-        return self.query_api("/api/v0/organizations")
+        return self.cached_query("/api/v0/organizations", "organizations")
 
     def get_templates(self, organization_id):
         """
@@ -282,26 +1022,35 @@ class Meraki_Connector(BaseConnector):
         URI = "https://dashboard.meraki.com/api/v0/organizations/530205/networks"
         return [{u'id': u'L_629378047925043760', u'name': u'quarantine', u'productTypes': [u'appliance',  u'wireless']}]
         """
-        return self.query_api("/api/v0/organizations/" + str(organization_id) + "/configTemplates")
+        return self.cached_query("/api/v0/organizations/" + str(organization_id) + "/configTemplates", "configTemplates")
 
-    def get_template_name(self, templates, template_id):
+    def index_templates(self, templates):
         """
-        Return the name of a template from a list of templates, given the template ID. Return None if not found.
+        Return the templates of an organization indexed by name and by ID.
         """
-        for template in templates:
-            if template['id'] == template_id:
-                return template.get('name')
-        return None
+        return dict(name=dict((template['name'], template) for template in templates),
+                    id=dict((template['id'], template) for template in templates))
+
+    def get_template_name(self, template_index, template_id):
+        """
+        Return the name of a template from the template index, given the template ID. Return None if not found.
+        """
+        return template_index['id'].get(template_id, {}).get('name')
 
-    def get_networks(self, organization_id):
+    def get_networks(self, organization_id, cached=True):
         """
         Return a list of network IDs for this organization
         URI = "https://dashboard.meraki.com/api/v0/organizations/530205/networks"
         return [{u'configTemplateId': u'L_629378047925043759', u'disableMyMerakiCom': False, u'disableRemoteStatusPage': True,
                  u'id': u'N_629378047925100521', u'name': u'GENE', u'organizationId': u'530205', u'productTypes': [u'appliance'],
                  u'tags': None, u'timeZone': u'America/Los_Angeles', u'type': u'appliance'}]
+
+        bind network needs the current configTemplateId of each network, so it calls with cached=False.
         """
-        return self.query_api("/api/v0/organizations/" + str(organization_id) + "/networks")
+        URL = "/api/v0/organizations/" + str(organization_id) + "/networks"
+        if not cached:
+            return self.query_api(URL, PAGE_SIZE.get("networks"))
+        return self.cached_query(URL, "networks", PAGE_SIZE.get("networks"))
 
     def get_devices(self, network_id):
         """
@@ -311,46 +1060,98 @@ class Meraki_Connector(BaseConnector):
                  u'mac': u'88:15:44:08:ad:08',  u'model': u'MX64',  u'name': u'SWISSWOOD-MX64', u'serial': u'Q2KN-R9P3-3U6X',
                  u'tags': u' recently-added ', u'wan1Ip': u'192.168.0.3', u'wan2Ip': None}]
         """
-        return self.query_api("/api/v0/networks/" + network_id + "/devices")
+        return self.cached_query("/api/v0/networks/" + network_id + "/devices", "devices", PAGE_SIZE.get("devices"))
 
-    def get_clients(self, serial, timespan):
+    def get_clients(self, serial, timespan, keep=None, none_on_error=False):
         """
-        Return a list of clients associated with this device serial number.
+        Return a list of clients associated with this device serial number, and the count of clients.
         URI = "https://dashboard.meraki.com/api/v0/devices/Q2HP-NAY7-A2WH/clients?timespan=86400"
         return [{u'description': u'alpha_b-THINK-7', u'dhcpHostname': u'alpha_b-THINK-7', u'id': u'k7c0271',
                  u'mac': u'60:6c:77:01:22:42',
-                 u'mdnsName': None, u'switchport': u'3', u'usage': {u'recv': 14168.0, u'sent': 124917.00000000001}}]
+                 u'mdnsName': None, u'switchport': u'3', u'usage': {u'recv': 14168.0, u'sent': 124917.00000000001}}], 1
+
+        The pages are consumed as they arrive. With keep, a function called with each client, the list holds only the
+        values it returns other than None, so the clients of a device are never all held at once. On error the list is
+        empty, or None with none_on_error.
+        """
+        timespan = str(min(int(timespan), MAX_TIMESPAN))
+        clients = []
+        count = 0
+        for page in self.query_pages("/api/v0/devices/" + serial + "/clients?timespan=" + timespan, PAGE_SIZE.get("clients")):
+            if page is None:
+                return (None if none_on_error else []), 0
+            count += len(page)
+            for client in page:
+                value = keep(client) if keep else client
+                if value is not None:
+                    clients.append(value)
+        return clients, count
+
+    def cached_query(self, URL, kind, per_page=None):
+        """
+        Return the inventory from the cache if present and not expired, otherwise query the API and cache the result.
+        Empty lists are not cached, query_api also returns an empty list on error.
         """
-        if timespan > 2592000:
-            timespan = 2592000
-        timespan = str(timespan)
-        return self.query_api("/api/v0/devices/" + serial + "/clients?timespan=" + timespan)
+        if self.cache is None:
+            return self.query_api(URL, per_page)
 
-    def query_api(self, URL):
+        value = self.cache.get(URL, kind)
+        if value is None:
+            value = self.query_api(URL, per_page)
+            if value:
+                self.cache.put(URL, value)
+        return value
+
+    def query_api(self, URL, per_page=None, none_on_error=False):
         """
         Method to query and return results, return an empty list if there are connection error(s).
         Update 1.8 Return empty list for non OK return codes.
+        Update 3.1 The items of all pages are returned, an empty list if any page fails.
+        Update 3.5 With none_on_error, return None on error, so the caller can tell an error from no items.
+        Update 3.6 Used for the small inventory endpoints, the clients of a device are consumed page by page by get_clients.
         """
-        header = self.HEADER
-        header["X-Cisco-Meraki-API-Key"] = self.get_configuration("Meraki-API-Key")
-        URI = "https://" + self.get_configuration("dashboard") + URL
-        try:
-            r = self.rate_limit(requests.get, URI, headers=header, verify=False)
-        except requests.ConnectionError as e:
-            self.set_status_save_progress(phantom.APP_ERROR, str(e))
-            return []
+        items = []
+        for page in self.query_pages(URL, per_page):
+            if page is None:
+                return None if none_on_error else []
+            items.extend(page)
+        return items
+
+    def query_pages(self, URL, per_page=None):
+        """
+        Generator which yields the results of a GET one page at a time. If per_page is specified it is sent as the
+        perPage query parameter, the next page is the rel=next URL of the Link header. Each page is decoded as it
+        arrives, so only one page body is held at a time. A response which is not a list is yielded as a one item page.
+        On a connection error or a non OK return code, None is yielded and the generator ends.
+        """
+        URI = self.api_url(URL)
+        if per_page:
+            URI += ("&" if "?" in URI else "?") + "perPage=%s" % per_page
 
-        self.status_code.append(r.status_code)
-        if r.status_code in self.OK:
-            pass
-        else:
-            self.debug_print("%s QUERY_API url: %s status code: %s" % (Meraki_Connector.BANNER, URI, r.status_code))
-            return []
+        while URI:
+            try:
+                r = self.rate_limit(self.get_session().get, URI)
+            except requests.ConnectionError as e:
+                self.set_status_save_progress(phantom.APP_ERROR, str(e))
+                self.shard = None                          # the next call goes to the dashboard, which redirects to the current shard
+                yield None
+                return
+
+            self.learn_shard(r)
+            self.status_code.append(r.status_code)
+            if r.status_code not in self.OK:
+                self.debug_print("%s QUERY_API url: %s status code: %s" % (Meraki_Connector.BANNER, URI, r.status_code))
+                yield None
+                return
 
-        try:
-            return r.json()
-        except ValueError:                                 # If you get a 404 error, throws a ValueError exception
-            return []
+            try:
+                page = r.json()
+            except ValueError:                             # If you get a 404 error, throws a ValueError exception
+                yield None
+                return
+
+            yield page if isinstance(page, list) else [page]
+            URI = r.links.get("next", {}).get("url")
 
     def post_api(self, URL, body=dict()):
         """
@@ -358,15 +1159,15 @@ class Meraki_Connector(BaseConnector):
         """
         self.debug_print("%s POST_API url: %s %s " % (Meraki_Connector.BANNER, URL, body))
 
-        header = self.HEADER
-        header["X-Cisco-Meraki-API-Key"] = self.get_configuration("Meraki-API-Key")
-        URI = "https://" + self.get_configuration("dashboard") + URL
+        URI = self.api_url(URL)
         try:
-            r = self.rate_limit(requests.post, URI, headers=header, data=json.dumps(body), verify=False)
+            r = self.rate_limit(self.get_session().post, URI, data=json.dumps(body))
         except requests.ConnectionError as e:
             self.set_status_save_progress(phantom.APP_ERROR, str(e))
+            self.shard = None
             return False
 
+        self.learn_shard(r)
         self.status_code.append(r.status_code)
         if r.status_code in self.OK:
             return True
@@ -374,25 +1175,130 @@ class Meraki_Connector(BaseConnector):
             self.debug_print("%s POST_API url: %s status code: %s text: %s" % (Meraki_Connector.BANNER, URI, r.status_code, r.text))
             return False
 
+    def get_session(self):
+        """
+        Return the requests session used for all API calls. The connection pool is sized to the number of worker threads
+        so each worker keeps its own keep-alive connection to the dashboard, rather than a TCP and TLS handshake per call.
+        """
+        if self.session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=self.get_configuration("concurrency"))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)              # a dashboard URL of http://host:port is a local stub server
+            session.headers.update(self.HEADER)
+            session.headers["X-Cisco-Meraki-API-Key"] = self.get_configuration("Meraki-API-Key")
+            session.verify = False
+            self.session = session
+        return self.session
+
+    def api_url(self, URL, use_shard=True):
+        """
+        Return the URI for the API call, using the shard host (e.g. n149.meraki.com) once it is known
+        to avoid the 3xx redirect from the dashboard on every call.
+
+        The dashboard is normally a host name and HTTPS is used. It may also be a URL, for example
+        http://127.0.0.1:8080 to run the connector against a local server which mimics the dashboard.
+        """
+        scheme, _, host = self.get_configuration("dashboard").rpartition("://")
+        if use_shard and self.shard:
+            host = self.shard
+        return (scheme or "https") + "://" + host.rstrip("/") + URL
+
+    def learn_shard(self, response):
+        """
+        If the request was redirected, remember the host which processed it, the shard is saved in the inventory cache
+        so subsequent actions on this asset go straight to the right node.
+        """
+        if not response.history:
+            return
+        host = urlparse(response.url).netloc
+        if host and host != self.shard:
+            self.debug_print("%s LEARN_SHARD %s" % (Meraki_Connector.BANNER, host))
+            self.shard = host
+            if self.cache:
+                self.cache.put("shard", host)
+
     def rate_limit(self, api_call, url, **kwargs):
         """
         Handles the rate_limiting feature of Meraki Cloud - refer to
         https://developer.cisco.com/meraki/api/#/rest/guides/rate-limit/tips-to-avoid-being-rate-limited
         RL_RETRY is defined the the connector constants file should the end user need to increate the retries.
 
+        Every call, including retries, first takes a token from the shared bucket; the time spent waiting is
+        appended to self.throttle_wait. A 429 still honors Retry-After by pausing the bucket for all threads.
+
+        Each call is recorded in self.calls with the endpoint template, method, status code, response bytes, the number
+        of 429 retries, the seconds waiting on the rate limiter (throttle) and the remaining seconds (latency).
+
         Returns the requests object to the calling method. Calling method to catch ConnectionError exceptions.
         """
+        if self.bucket is None:
+            self.bucket = TokenBucket(self.get_configuration("rate_limit"))
 
-        for _ in range(RL_RETRY):
+        record = dict(endpoint=self.endpoint_template(url), method=api_call.__name__.upper(), status=None,
+                      bytes=0, retries=0, throttle=0.0)
+        started = time.time()
+        try:
+            for _ in range(RL_RETRY):
+
+                wait = self.bucket.acquire()
+                self.throttle_wait.append(wait)
+                record['throttle'] += wait
+                response = api_call(url, **kwargs)
+                record['status'] = response.status_code
+
+                if response.status_code == self.RATE_LIMIT_EXCEEDED:
+                    record['retries'] += 1
+                    self.bucket.pause(int(response.headers.get("Retry-After", 1)))
+                else:
+                    break
 
-            response = api_call(url, **kwargs)
+            record['bytes'] = len(response.content)
+            return response
+        finally:
+            record['latency'] = time.time() - started - record['throttle']
+            self.calls.append(record)
 
-            if response.status_code == self.RATE_LIMIT_EXCEEDED:
-                time.sleep(int(response.headers.get("Retry-After"), 1))
-            else:
-                return response
+    def endpoint_template(self, url):
+        """
+        Return the path of the URL with the identifiers replaced, e.g. /api/v0/devices/{serial}/clients
+        so calls to the same endpoint can be aggregated.
+        """
+        segments = urlparse(url).path.split("/")
+        for i in range(1, len(segments)):
+            if segments[i - 1] in ENDPOINT_IDS:
+                segments[i] = ENDPOINT_IDS[segments[i - 1]]
+        return "/".join(segments)
 
-        return response
+    def timing_report(self):
+        """
+        Summarize the API calls made since the current action began: for each method and endpoint template the call
+        count, 50th and 95th percentile latency, bytes, errors and retries; and in total the calls, bytes, seconds
+        waiting on the rate limiter, seconds of network latency (summed over all threads) and elapsed seconds.
+        """
+        started, mark = self.action_started
+        calls = self.calls[mark:]
+
+        endpoints = {}
+        for record in calls:
+            endpoints.setdefault("%s %s" % (record['method'], record['endpoint']), []).append(record)
+
+        report = dict(calls=len(calls), endpoints={},
+                      bytes=sum(record['bytes'] for record in calls),
+                      throttle_wait=round(sum(record['throttle'] for record in calls), 3),
+                      latency=round(sum(record['latency'] for record in calls), 3),
+                      elapsed=round(time.time() - started, 3))
+
+        for endpoint, records in endpoints.items():
+            latency = sorted(record['latency'] for record in records)
+            report['endpoints'][endpoint] = dict(calls=len(records),
+                                                 p50=round(latency[int(0.50 * (len(latency) - 1))], 3),
+                                                 p95=round(latency[int(0.95 * (len(latency) - 1))], 3),
+                                                 bytes=sum(record['bytes'] for record in records),
+                                                 errors=len([record for record in records if record['status'] not in self.OK]),
+                                                 retries=sum(record['retries'] for record in records),
+                                                 throttle_wait=round(sum(record['throttle'] for record in records), 3))
+        return report
 
     def handle_action(self, param):
         """
@@ -410,10 +1316,12 @@ class Meraki_Connector(BaseConnector):
 
         supported_actions = {"test connectivity": self._test_connectivity,
                             "bind network": self.bind_network,
-                            "locate device": self.locate_device}
+                            "locate device": self.locate_device,
+                            "on poll": self.refresh_client_index}
 
         run_action = supported_actions[action_id]
 
+        self.action_started = (time.time(), len(self.calls))
         return run_action(param)
 
 
@@ -1,3 +1,21 @@
 # file name would be ./meraki_connector_consts.py
 DASHBOARD = "dashboard.meraki.com"
 RL_RETRY = 4                                               # Number of time to retry API call when flagged for rate limiting
+WALK_CONCURRENCY = 4                                       # Default worker threads for the locate device tree walk
+MAX_CONCURRENCY = 10                                       # Upper bound on worker threads, the dashboard allows 10 calls per second per org
+RL_CALLS_PER_SECOND = 5                                    # Default API calls per second for the token bucket rate limiter
+CACHE_TTL = {"organizations": 86400,                      # Seconds an inventory object is cached in the app state directory
+             "configTemplates": 86400,
+             "networks": 3600,
+             "devices": 3600,
+             "shard": 86400}
+CLIENT_INDEX_TTL = 900                                     # Seconds the client index can answer locate device before a walk is required
+CLIENT_INDEX_TIMESPAN = 86400                              # Timespan (seconds) used by on poll to rebuild the client index
+DELTA_OVERLAP = 60                                         # Seconds added to the timespan since the last poll in delta mode
+PAGE_SIZE = {"networks": 1000}                            # perPage for paginated endpoints, all endpoints follow the Link header
+ENDPOINT_IDS = {"organizations": "{organizationId}",       # Identifiers replaced in the URL path to aggregate call timing by endpoint
+                "networks": "{networkId}",
+                "devices": "{serial}",
+                "configTemplates": "{configTemplateId}"}
+MAX_TIMESPAN = 2592000                                     # Maximum timespan (seconds) of the clients API, 30 days
+ADAPTIVE_TIMESPANS = (900, 3600, 86400)                    # Timespans (seconds) tried in turn by adaptive locate device